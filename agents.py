@@ -3,6 +3,7 @@ import logfire
 from typing import List, Optional
 from models import IntensityType, Target, Interval, WorkoutComponent
 from pydantic_core import ValidationError
+from utils import minutes_to_secs, pace_to_speed_mps
 
 
 ExtractWorkoutComponentsAgent = Agent(
@@ -42,6 +43,7 @@ ExtractIntervalsAgent = Agent(
     your goal is to analyze each component and its subsets to produce a nested Interval object. Follow these steps for each component:
     Identify Component Type:
         If the component has repetitions, it represents a repeated set and should use the repeat exit_trigger_type. Don't set targets in that case
+        The exit_trigger_value of a repeated set is the number of repetitions minus one, since the first iteration is not counted as a repeat
         If no repetitions are present, the interval is singular and should use time or distance based on the parameters
     Extract Parameters:
         Parse the parameters string to determine duration (Time) or distance, effort level, and pace.
@@ -104,7 +106,7 @@ ExtractIntervalsAgent = Agent(
     Interval(
         name="2 Intervals",
         exit_trigger_type="repeat",
-        exit_trigger_value=5,
+        exit_trigger_value=4,  # 5 repetitions : the first iteration and 4 repeats
         intensity_type=None,
         targets=None,
         intervals=[
@@ -149,7 +151,7 @@ def to_inverval_obj(name:Optional[str], exit_trigger_type:str, exit_trigger_valu
 
     name : Display name for the interval 
     exit_trigger_type : can be one of time, distance or repeat (use repeat if you want to repeat several times this interval)
-    exit_trigger_value : Value for the exit trigger (duration in seconds, distance in meters, or repetitions)
+    exit_trigger_value : Value for the exit trigger (duration in seconds, distance in meters, or repeats after the first iteration)
     intensity_type : one of 'active', 'warm up', 'tempo', 'lactate threshold', 'maximal aerobic power', 'anaerobic capacity', 'cool down', 'recovery' or 'rest'
     targets : List of target values and controls for the interval, valid only if exit_trigger_type is not 'repeat'
     intervals : Nested intervals used for repetitions when exit_trigger_type is 'repeat'
@@ -172,13 +174,12 @@ def to_inverval_obj(name:Optional[str], exit_trigger_type:str, exit_trigger_valu
 @ExtractIntervalsAgent.tool_plain
 def from_minutes_to_secs(minutes:int, seconds:int):
     # Transforms the input from minutes to seconds
-    return minutes*60 + seconds
+    return minutes_to_secs(minutes, seconds)
 
 @ExtractIntervalsAgent.tool_plain(retries=1)
 def from_pace_to_speed_mps(pace_min:int, pace_sec:int):
     # Transforms a pace to meters per second
-    total_seconds_per_km = (pace_min * 60) + pace_sec
-    return round(1000 / total_seconds_per_km, 3)
+    return pace_to_speed_mps(pace_min, pace_sec)
 
 
 WorkoutGenerationAgent = Agent(  
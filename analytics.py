@@ -0,0 +1,43 @@
+import numpy as np
+
+# Best effort name -> distance in meters
+BEST_EFFORT_DISTANCES = {
+    '1k':1000,
+    '5k':5000,
+    '10k':10000,
+    'half':21097.5,
+}
+
+
+def best_efforts(elapsed:np.ndarray, distance:np.ndarray, distances:dict[str, float]=BEST_EFFORT_DISTANCES) -> dict[str, float|None]:
+    """
+    Fastest time in seconds to cover each distance within a workout, or None if the workout is shorter.
+
+    For every record j, the latest record i with distance[j] - distance[i] >= D is
+    found by one vectorized binary search over the cumulative distance : O(n log n)
+    per distance, but in numpy, which beats an O(n) two-pointer loop in Python.
+    """
+
+    elapsed = np.asarray(elapsed, dtype=np.float64)
+    distance = np.asarray(distance, dtype=np.float64)
+
+    valid = ~np.isnan(distance)
+    elapsed, distance = elapsed[valid], distance[valid]
+
+    # GPS noise can make the accumulated distance go back slightly
+    distance = np.maximum.accumulate(distance) if len(distance) else distance
+
+    output = {}
+
+    for name, target in distances.items():
+
+        if len(distance) == 0 or distance[-1] - distance[0] < target:
+            output[name] = None
+            continue
+
+        ends = np.nonzero(distance - distance[0] >= target)[0]
+        starts = np.searchsorted(distance, distance[ends] - target, side='right') - 1
+
+        output[name] = float(np.min(elapsed[ends] - elapsed[starts]))
+
+    return output
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import math
+import time
+import httpx
+from datetime import datetime
+from typing import AsyncIterator
+from uuid import uuid4
+from auth import token_manager
+from connections import DatabaseAPI, WahooAPIBase, logger
+from fit_cache import fit_cache
+from http_client import HttpClient
+from models import WorkoutData, WorkoutEndpointResponseJSONModel, get_parse_pool, read_lap_values, submit_parse
+
+# The root logger is at INFO level, where httpx would log every request
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+class AsyncHttpClient(HttpClient):
+
+    """
+    asyncio version of HttpClient on a pooled httpx.AsyncClient, with the same
+    timeouts, retries, backoff and per-endpoint counters.
+    """
+
+    def __init__(self, max_connections:int=20, max_keepalive_connections:int=10, **kwargs):
+        super().__init__(pool_maxsize=max_connections, **kwargs)
+
+        connect_timeout, read_timeout = self.timeout
+
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+        )
+
+    @staticmethod
+    def _may_have_been_sent(error:Exception) -> bool:
+        return not isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+    transport_errors = (httpx.TransportError,)
+
+    async def request(self, method:str, url:str, endpoint:str|None=None, limiter=None, **kwargs) -> httpx.Response:
+        """Same as HttpClient.request, without blocking the event loop."""
+
+        method = method.upper()
+        endpoint = endpoint or self.endpoint_name(method, url)
+
+        start = time.perf_counter()
+        attempt = 0
+
+        while True:
+
+            response = None
+
+            if limiter is not None:
+                await limiter.acquire_async()
+
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except self.transport_errors as e:
+                if self._final_error(method, endpoint, start, attempt, e):
+                    raise
+            else:
+                if self._final_response(method, endpoint, start, attempt, response, limiter):
+                    return response
+
+            await asyncio.sleep(self._backoff(attempt, response, limiter))
+
+            attempt += 1
+
+    async def get(self, url:str, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url:str, **kwargs) -> httpx.Response:
+        return await self.request('POST', url, **kwargs)
+
+    async def delete(self, url:str, **kwargs) -> httpx.Response:
+        return await self.request('DELETE', url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class AsyncWahooAPI(WahooAPIBase):
+
+    """
+    asyncio version of WahooAPI, so many syncs, uploads and FIT downloads can share
+    one event loop. WahooAPI stays the synchronous API for existing callers.
+
+        async with AsyncWahooAPI() as wahoo:
+            workouts = await wahoo.read_workouts()
+    """
+
+    def __init__(self, base_url:str='https://api.wahooligan.com/v1/', athlete:str='default', client:AsyncHttpClient|None=None,
+                 token_manager=token_manager):
+        super().__init__(base_url=base_url, athlete=athlete, token_manager=token_manager)
+        self.client = client or AsyncHttpClient()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def headers(self) -> dict:
+        # A refresh is a blocking call, so the token is read in a thread
+        return {'Authorization':f'Bearer {await asyncio.to_thread(self.token_manager.get_access_token)}'}
+
+    async def _get_workouts_page(self, page:int, per_page:int) -> WorkoutEndpointResponseJSONModel:
+
+        response = await self.client.get(
+            self.base_url + 'workouts',
+            headers=await self.headers(),
+            params={'page':page, 'per_page':per_page},
+            limiter=self._limiter('read')
+        )
+
+        response.raise_for_status()
+
+        return self._parse_page(response.json())
+
+    async def iter_workouts(self, after:datetime|None=None, per_page:int=50) -> AsyncIterator[list[WorkoutData]]:
+        """Same as WahooAPI.iter_workouts : pages of workouts strictly after the UTC date, most recent first."""
+
+        self._check_after(after)
+
+        page_num = 1
+        next_page = asyncio.ensure_future(self._get_workouts_page(page_num, per_page))
+        num_seen = 0
+
+        try:
+            while next_page is not None:
+
+                page = await next_page
+                num_seen += page.num_received
+
+                page_num += 1
+                next_page = asyncio.ensure_future(self._get_workouts_page(page_num, per_page)) if self._has_more(page, num_seen, after) else None
+
+                if workouts := self._workouts_after(page, after):
+                    yield workouts
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def read_workouts(self, after:datetime|None=None, per_page:int=50, max_concurrency:int=8) -> list[WorkoutData]:
+        # After date is in UTC. After is strict
+        # A full read fetches the pages after the first one concurrently
+
+        if after:
+            return [w async for page in self.iter_workouts(after=after, per_page=per_page) for w in page]
+
+        first_page = await self._get_workouts_page(1, per_page)
+
+        # The first page tells how many pages there are
+        num_pages = math.ceil(first_page.total / per_page)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def get_page(page:int) -> WorkoutEndpointResponseJSONModel:
+            async with semaphore:
+                return await self._get_workouts_page(page, per_page)
+
+        pages = await asyncio.gather(*[get_page(p) for p in range(2, num_pages+1)])
+
+        return [w for page in [first_page, *pages] for w in page.workouts]
+
+    async def upload_workout_for_today(self, plan_id:int):
+
+        response = await self.client.post(
+            self.base_url + 'workouts',
+            headers=await self.headers(),
+            params=self._workout_for_today_payload(plan_id),
+            limiter=self._limiter('write')
+        )
+
+        self._check_response(response, 'Failed to upload workout to Wahoo server')
+
+        id_ = response.json()["id"]
+        logger.info(f'Uploaded to Wahoo server a new workout for today : id = {id_}.')
+
+    async def upload_plan(self, plan_as_b64_str:str, db:DatabaseAPI) -> int:
+
+        external_id = str(uuid4())
+
+        response = await self.client.post(
+            self.base_url + 'plans',
+            headers=await self.headers(),
+            params=self._plan_payload(plan_as_b64_str, external_id),
+            limiter=self._limiter('write')
+        )
+
+        self._check_response(response, 'Failed to upload new plan to server')
+
+        logger.info('Succesfully uploaded plan to Wahoo Server')
+
+        wahoo_id = response.json()['id']
+
+        # SQLite calls block, so they run in a thread
+        await asyncio.to_thread(db.add_plan, plan_as_b64_str, external_id, wahoo_id)
+
+        return wahoo_id
+
+    async def delete_plan(self, plan_id:int, db_file:str, logger:logging.Logger):
+
+        response = await self.client.delete(
+            self.base_url + f'plans/{plan_id}',
+            headers=await self.headers(),
+            limiter=self._limiter('write')
+        )
+
+        self._check_response(response, 'Failed to delete plan from server', logger)
+
+        logger.info(f'Succesfully deleted plan from wahoo server.')
+
+        await asyncio.to_thread(DatabaseAPI(db_file=db_file, logger=logger).delete_plan, plan_id)
+
+    async def delete_workout(self, workout_id:int):
+
+        response = await self.client.delete(
+            self.base_url + f'workouts/{workout_id}',
+            headers=await self.headers(),
+            limiter=self._limiter('write')
+        )
+
+        self._check_response(response, 'Failed to delete workout from server')
+
+        logger.info(f'Succesfully deleted workout from wahoo server.')
+
+    async def fetch_fit_file(self, workout:WorkoutData) -> bytes:
+        """Return the FIT file of a workout from the FIT cache, downloading it on a miss."""
+
+        url = workout._fit_file_url
+
+        content = await asyncio.to_thread(fit_cache.get, workout.id, url)
+
+        if content is not None:
+            return content
+
+        response = await self.client.get(url, endpoint='GET fit_file')
+
+        response.raise_for_status()
+
+        await asyncio.to_thread(fit_cache.put, workout.id, url, response.content)
+
+        return response.content
+
+    async def fetch_lap_values(self, workouts:list[WorkoutData]) -> list[list[dict]|Exception]:
+        """
+        Async counterpart of models.fetch_lap_values : downloads on the event loop, decoding in
+        the shared process pool. Returns the lap values or the exception of each workout, in order.
+        """
+
+        get_parse_pool()
+
+        async def fetch_and_parse(workout:WorkoutData) -> list[dict]:
+            content = await self.fetch_fit_file(workout)
+            return await asyncio.wrap_future(submit_parse(read_lap_values, content))
+
+        return await asyncio.gather(*[fetch_and_parse(w) for w in workouts], return_exceptions=True)
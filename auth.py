@@ -1,8 +1,9 @@
-import sqlite3
 import datetime
-import requests
+import threading
+from http_client import http_client
 import os
 from dotenv import load_dotenv
+from storage import get_connection_manager
 
 load_dotenv()
 
@@ -12,38 +13,38 @@ redirect_uri = os.getenv('REDIRECT_URI')
 
 class TokenManager:
 
-    def __init__(self, db_file, client_id, client_secret):
+    def __init__(self, db_file, client_id, client_secret, token_url='https://api.wahooligan.com/oauth/token', refresh_margin_s=300):
         self.db_file = db_file
         self.client_id = client_id
         self.client_secret = client_secret
+        self.token_url = token_url
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin_s) # Refresh this long before expiry
+        self.pool = get_connection_manager(db_file)
         self.create_token_table()
 
+        # Token cached in memory, so the database is only read once and written on refresh
+        self._access_token = None
+        self._access_token_expires_at = None
+        self._refresh_lock = threading.Lock()
+
     def create_token_table(self):
         """Create the token table if it doesn't exist."""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tokens (
-            id INTEGER PRIMARY KEY,
-            access_token TEXT NOT NULL,
-            access_token_expires_at DATETIME NOT NULL,
-            refresh_token TEXT NOT NULL
-        )
-        ''')
+        with self.pool.transaction() as cursor:
 
-        conn.commit()
-        conn.close()
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tokens (
+                id INTEGER PRIMARY KEY,
+                access_token TEXT NOT NULL,
+                access_token_expires_at DATETIME NOT NULL,
+                refresh_token TEXT NOT NULL
+            )
+            ''')
 
     def _get_tokens_from_db(self):
         """Fetch both access and refresh tokens from the database."""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT access_token, access_token_expires_at, refresh_token FROM tokens WHERE id = 1")
-        token_data = cursor.fetchone()
+        conn = self.pool.connection()
 
-        conn.close()
+        token_data = conn.execute("SELECT access_token, access_token_expires_at, refresh_token FROM tokens WHERE id = 1").fetchone()
 
         if token_data:
             access_token, access_token_expires_at_str, refresh_token = token_data
@@ -53,14 +54,9 @@ class TokenManager:
 
     def _store_tokens_in_db(self, access_token, access_token_expires_at, refresh_token):
         """Store both access token and refresh token along with expiration time in the database."""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
-        cursor.execute("INSERT OR REPLACE INTO tokens (id, access_token, access_token_expires_at, refresh_token) VALUES (1, ?, ?, ?)",
-                       (access_token, access_token_expires_at.strftime('%Y-%m-%d %H:%M:%S')+'+00:00', refresh_token))
-
-        conn.commit()
-        conn.close()
+        with self.pool.transaction() as cursor:
+            cursor.execute("INSERT OR REPLACE INTO tokens (id, access_token, access_token_expires_at, refresh_token) VALUES (1, ?, ?, ?)",
+                           (access_token, access_token_expires_at.strftime('%Y-%m-%d %H:%M:%S')+'+00:00', refresh_token))
 
     def _is_token_expired(self, expires_at):
         """Check if the access token has expired."""
@@ -70,16 +66,32 @@ class TokenManager:
 
         return now_utc >= expires_at
 
+    def _is_cached_token_valid(self):
+        """Check if the cached access token exists and is not about to expire."""
+        return self._access_token is not None and not self._is_token_expired(self._access_token_expires_at - self.refresh_margin)
+
     def get_access_token(self):
         """Get the current access token, refreshing it if necessary."""
-        access_token, access_token_expires_at, refresh_token = self._get_tokens_from_db()
 
-        if access_token and not self._is_token_expired(access_token_expires_at):
-            return access_token
+        # Fast path, without lock nor database
+        if self._is_cached_token_valid():
+            return self._access_token
 
-        self._refresh_access_token(refresh_token)
-        access_token, _, _ = self._get_tokens_from_db()
-        return access_token
+        # Only one thread refreshes : the others wait and then use its token
+        with self._refresh_lock:
+
+            if self._is_cached_token_valid():
+                return self._access_token
+
+            access_token, access_token_expires_at, refresh_token = self._get_tokens_from_db()
+
+            if access_token and not self._is_token_expired(access_token_expires_at - self.refresh_margin):
+                self._access_token, self._access_token_expires_at = access_token, access_token_expires_at
+                return access_token
+
+            self._refresh_access_token(refresh_token)
+
+            return self._access_token
 
     def _refresh_access_token(self, refresh_token):
         """Refresh the access token using the refresh token."""
@@ -87,8 +99,13 @@ class TokenManager:
             raise ValueError("No refresh token available")
 
         # Send the request to refresh the token
-        token_url = f"https://api.wahooligan.com/oauth/token?client_secret={self.client_secret}&client_id={self.client_id}&grant_type=refresh_token&refresh_token={refresh_token}"
-        response = requests.post(token_url)
+        params = {
+            'client_secret':self.client_secret,
+            'client_id':self.client_id,
+            'grant_type':'refresh_token',
+            'refresh_token':refresh_token
+        }
+        response = http_client.post(self.token_url, params=params, endpoint='POST /oauth/token')
 
         if response.status_code != 200:
             raise Exception(f"Failed to refresh token: {response.status_code} {response.text}")
@@ -105,6 +122,8 @@ class TokenManager:
         # Store the new access token and refresh token
         self._store_tokens_in_db(access_token, access_token_expires_at, refresh_token)
 
+        self._access_token, self._access_token_expires_at = access_token, access_token_expires_at
+
 
 
 token_manager = TokenManager(
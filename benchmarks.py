@@ -0,0 +1,256 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import fitparse
+from contextlib import contextmanager
+from datetime import datetime, date, UTC, timedelta
+from io import BytesIO
+import fit_decoder
+from fit_cache import fit_cache
+from models import WorkoutData, WorkoutEndpointResponseJSONModel, Interval, Plan
+from synthetic import synthetic_fit_file, synthetic_workout, synthetic_plan
+from utils import speed_to_pace
+
+# Baselines are machine-specific : each machine saves its own with --save-baseline (the file is not committed)
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks_baseline.json')
+REGRESSION_THRESHOLD = 0.25 # A benchmark regresses when even its fastest run is this much slower than the baseline median
+
+
+def timed(func, *args, repeat:int=5) -> float:
+    """Return the best wall time of repeat calls, in milliseconds."""
+
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+
+    return best * 1000
+
+def per_call_us(func, number:int, repeat:int=7) -> list[float]:
+    """Return the time of one call in each of repeat runs of number calls, in microseconds."""
+
+    return [t / number * 1e6 for t in timeit.Timer(func).repeat(repeat=repeat, number=number)]
+
+def summarize(samples:list[float]) -> dict[str, float]:
+    """Median, fastest run and relative spread between the quartiles of a benchmark's runs."""
+
+    quartiles = statistics.quantiles(samples, n=4)
+
+    return {'median_us':quartiles[1], 'min_us':min(samples), 'spread':(quartiles[2] - quartiles[0]) / quartiles[1]}
+
+def _fitparse_laps(content:bytes) -> list:
+    return [lap.get_values() for lap in fitparse.FitFile(BytesIO(content)).get_messages('lap')]
+
+def _decoder_laps(content:bytes) -> list:
+    return fit_decoder.decode_messages(content, messages=('lap',))['lap']
+
+def bench_lap_decoding(hours:tuple[float, ...]=(1, 3, 5)) -> dict[str, dict]:
+    """Compare lap extraction with fitparse and with the lap-only decoder on synthetic files."""
+
+    results = {}
+
+    for h in hours:
+
+        content = synthetic_fit_file(seconds=int(h * 3600))
+
+        fitparse_ms = timed(_fitparse_laps, content, repeat=1)
+        decoder_ms = timed(_decoder_laps, content)
+
+        assert len(_fitparse_laps(content)) == len(_decoder_laps(content))
+
+        results[f'{h}h'] = {
+            'size_kb':len(content) / 1024,
+            'fitparse_ms':fitparse_ms,
+            'decoder_ms':decoder_ms,
+            'speedup':fitparse_ms / decoder_ms
+        }
+
+    return results
+
+
+# Fixtures
+
+def _workout_dicts(num:int) -> list[dict]:
+    latest = datetime(2024, 6, 1, 7, 30, tzinfo=UTC)
+    return [synthetic_workout(num - i, latest - i * timedelta(hours=12), 30 + i % 60) for i in range(num)]
+
+@contextmanager
+def _temporary_fit_cache():
+    """Point the FIT cache to a temporary directory, so WorkoutData.laps only reads local files."""
+
+    cache_dir = fit_cache.cache_dir
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fit_cache.cache_dir = tmp_dir
+        try:
+            yield
+        finally:
+            fit_cache.cache_dir = cache_dir
+
+@contextmanager
+def _populated_database(num_rows:int, feedback_every:int=3):
+    """Temporary database with num_rows workouts, one in feedback_every of them with feedback."""
+
+    from connections import DatabaseAPI # Imported here : it reads the credentials and opens the token database
+
+    logger = logging.getLogger('benchmarks')
+    logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        db = DatabaseAPI(db_file=os.path.join(tmp_dir, 'db.sqlite3'), logger=logger)
+        db._create_all_tables()
+
+        workouts = [WorkoutData(**w) for w in _workout_dicts(num_rows)]
+        db.upload_workouts(workouts, chunk_size=5000)
+
+        with db.pool.transaction() as cursor:
+            cursor.executemany(
+                'INSERT INTO feedback (workout_id, rpe, feedback) VALUES (?, ?, ?)',
+                [(w.id, 1 + w.id % 10, f'Felt {w.id % 10}/10') for w in workouts[::feedback_every]]
+            )
+
+        try:
+            yield db, [w.id for w in workouts]
+        finally:
+            db.pool.close_all()
+
+
+# Benchmarks : name -> time of one call in each run, in microseconds
+
+def bench_models() -> dict[str, list[float]]:
+
+    page_dict = {'workouts':_workout_dicts(50), 'total':10_000, 'page':1, 'per_page':50, 'order':'descending', 'sort':'starts'}
+    workout_dict = page_dict['workouts'][0]
+    row = (*[workout_dict[k] for k in ('id', 'starts', 'minutes', 'name', 'plan_id', 'route_id', 'workout_token', 'workout_type_id', 'day_code')],
+           json.dumps(workout_dict['workout_summary']), '2024-06-01T07:30:00.000+00:00', '2024-06-01T07:30:00.000+00:00')
+
+    plan = Plan(**synthetic_plan(depth=4, width=3))
+    interval = plan.intervals[0]
+    interval_dump = interval.model_dump(exclude_none=True)
+
+    return {
+        'speed_to_pace':per_call_us(lambda: speed_to_pace(3.21), number=100_000),
+        'WorkoutData()':per_call_us(lambda: WorkoutData(**workout_dict), number=10_000),
+        'WorkoutData.parse_and_convert_to_UTC':per_call_us(
+            lambda: WorkoutData.parse_and_convert_to_UTC(workout_dict['starts']), number=100_000
+        ),
+        'WorkoutData.from_db_row':per_call_us(lambda: WorkoutData.from_db_row(row), number=10_000),
+        'WorkoutData.from_db_row + workout_summary':per_call_us(lambda: WorkoutData.from_db_row(row).workout_summary, number=10_000),
+        'WorkoutEndpointResponseJSONModel.from_page(50 workouts)':per_call_us(lambda: WorkoutEndpointResponseJSONModel.from_page(page_dict), number=200),
+        'Interval.model_dump(depth 4)':per_call_us(lambda: interval.model_dump(exclude_none=True), number=500),
+        'Interval._convert_enums(depth 4)':per_call_us(lambda: Interval._convert_enums(interval_dump), number=500),
+        'Plan.to_payload(depth 4)':per_call_us(plan.to_payload, number=200),
+    }
+
+def bench_laps(hours:float=1) -> dict[str, list[float]]:
+
+    url = 'http://localhost/files/benchmark.fit'
+    workout = WorkoutData(**synthetic_workout(1, datetime(2024, 6, 1, tzinfo=UTC), int(hours * 60), fit_file_url=url))
+
+    with _temporary_fit_cache():
+        fit_cache.put(workout.id, url, synthetic_fit_file(seconds=int(hours * 3600)))
+
+        return {f'WorkoutData.laps({hours}h)':per_call_us(lambda: workout.laps, number=20)}
+
+def bench_database(num_rows:int=100_000) -> dict[str, list[float]]:
+
+    with _populated_database(num_rows) as (db, workout_ids):
+
+        recent_ids = workout_ids[:1000]
+
+        return {
+            'get_recent_workouts_data(5)':per_call_us(lambda: db.get_recent_workouts_data(5), number=200),
+            'get_recent_workouts_data(500)':per_call_us(lambda: db.get_recent_workouts_data(500), number=5),
+            'get_feedback_from_workouts(5)':per_call_us(lambda: db.get_feedback_from_workouts(recent_ids[:5]), number=200),
+            'get_feedback_from_workouts(1000)':per_call_us(lambda: db.get_feedback_from_workouts(recent_ids), number=5),
+            'get_feedbacks_from_workouts(1000)':per_call_us(lambda: db.get_feedbacks_from_workouts(recent_ids), number=5),
+            'get_recent_workouts_with_feedback(5)':per_call_us(lambda: db.get_recent_workouts_with_feedback(5), number=200),
+            'weekly_volume(520)':per_call_us(lambda: db.weekly_volume(520, until=date(2024, 6, 1)), number=5),
+        }
+
+def run_suite(num_rows:int=100_000) -> dict[str, dict[str, float]]:
+    samples = {**bench_models(), **bench_laps(), **bench_database(num_rows)}
+    return {name:summarize(values) for name, values in samples.items()}
+
+
+# Baselines
+
+def load_baseline(path:str=BASELINE_FILE) -> dict[str, dict[str, float]]:
+
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)['results']
+
+def save_baseline(results:dict[str, dict[str, float]], path:str=BASELINE_FILE):
+
+    with open(path, 'w') as f:
+        json.dump({'python':sys.version.split()[0], 'created_at':datetime.now(UTC).isoformat(timespec='seconds'), 'results':results}, f, indent=2)
+
+def compare(result:dict[str, float], baseline:dict[str, float], threshold:float=REGRESSION_THRESHOLD) -> str:
+    """
+    'regression' when even the fastest run is slower than the baseline median by more than threshold,
+    'noisy' when the runs of either side spread more than threshold (rerun on a quieter machine), else 'ok'.
+    """
+
+    if max(result['spread'], baseline['spread']) > threshold:
+        return 'noisy'
+
+    if result['min_us'] > baseline['median_us'] * (1 + threshold):
+        return 'regression'
+
+    return 'ok'
+
+def find_regressions(results:dict[str, dict[str, float]], baseline:dict[str, dict[str, float]], threshold:float=REGRESSION_THRESHOLD) -> dict[str, float]:
+    """Benchmarks that regressed against their baseline, with the ratio of their medians."""
+
+    return {
+        name:results[name]['median_us'] / baseline[name]['median_us']
+        for name in results
+        if name in baseline and compare(results[name], baseline[name], threshold) == 'regression'
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the hot paths, compared to the baseline saved on this machine')
+    parser.add_argument('--rows', type=int, default=100_000, help='Workouts in the benchmark database')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='Allowed slowdown before failing, 0.25 = 25%%')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the baseline of this machine')
+    parser.add_argument('--laps', action='store_true', help='Also compare fitparse and the lap decoder')
+    args = parser.parse_args()
+
+    if args.laps:
+        for name, result in bench_lap_decoding().items():
+            print(
+                f'{name:>5} ({result["size_kb"]:0.0f}kB) : fitparse {result["fitparse_ms"]:0.1f}ms, '
+                f'decoder {result["decoder_ms"]:0.2f}ms ({result["speedup"]:0.0f}x)'
+            )
+
+    results = run_suite(args.rows)
+    baseline = load_baseline()
+
+    for name, result in results.items():
+        if name in baseline:
+            change = f'{(result["median_us"] / baseline[name]["median_us"] - 1) * 100:+6.1f}%  {compare(result, baseline[name], args.threshold)}'
+        else:
+            change = '    new'
+        print(f'{name:<56} {result["median_us"]:12.2f}us ±{result["spread"] * 100:4.0f}%  {change}')
+
+    if args.save_baseline:
+        save_baseline(results)
+        print(f'Saved baseline to {BASELINE_FILE}')
+    elif regressions := find_regressions(results, baseline, args.threshold):
+        for name, ratio in regressions.items():
+            print(f'REGRESSION {name} : median {ratio:0.2f}x the baseline')
+        sys.exit(1)
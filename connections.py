@@ -1,21 +1,86 @@
-import requests
+from http_client import http_client
+from rate_limiter import rate_limiter
 from auth import token_manager
-from datetime import datetime, UTC, timedelta
-from models import WorkoutData, WorkoutEndpointResponseJSONModel
+from datetime import datetime, UTC, timedelta, date
+from models import WorkoutData, WorkoutEndpointResponseJSONModel, LAP_FIELDS, RUNNING_WORKOUT_TYPES, fetch_lap_values, format_lap, get_parse_pool, submit_parse
 import sqlite3
 import json
 import logging
+import time
 from utils import setup_logger
+from record_streams import record_store, convert_workout_records
+from concurrent.futures import ThreadPoolExecutor
+import math
+from analytics import best_efforts, BEST_EFFORT_DISTANCES
+from training_load import workout_load, ewma_series, DEFAULT_THRESHOLD_SPEED
+from storage import get_connection_manager
 from uuid import uuid4
+from typing import Iterable, Iterator
 
 logger = setup_logger('api_logs.log')
 
+# Columns of the workouts table in the order WorkoutData.from_db_row expects
+WORKOUT_COLUMNS = 'id, starts, minutes, name, plan_id, route_id, workout_token, workout_type_id, day_code, workout_summary, created_at, updated_at'
+
+# SQL condition on a workouts table alias w, true for runs
+IS_RUN = f'w.workout_type_id IN ({", ".join(map(str, RUNNING_WORKOUT_TYPES))})'
+
+# Queries run by DatabaseAPI, shared with its query plan check (DatabaseAPI.hot_queries)
+MOST_RECENT_START_QUERY = 'SELECT MAX(starts) FROM workouts'
+MOST_RECENT_WORKOUT_ID_QUERY = 'SELECT id FROM workouts WHERE starts = (SELECT MAX(starts) FROM workouts)'
+RECENT_WORKOUTS_QUERY = f'SELECT {WORKOUT_COLUMNS} FROM workouts ORDER BY starts DESC LIMIT ?'
+
+RECENT_WORKOUTS_WITH_FEEDBACK_QUERY = f"""
+SELECT w.*, f.rpe, f.feedback, f.created_at
+FROM ({RECENT_WORKOUTS_QUERY}) AS w
+LEFT JOIN feedback AS f ON f.workout_id = w.id
+ORDER BY w.starts DESC, w.id, f.id DESC
+"""
+
+FEEDBACKS_OF_WORKOUTS_QUERY = """
+SELECT workout_id, rpe, feedback, created_at FROM feedback
+WHERE workout_id IN (SELECT value FROM json_each(?))
+ORDER BY workout_id, id DESC
+"""
+
+LAPS_OF_WORKOUTS_QUERY = f"""
+SELECT workout_id, {', '.join(LAP_FIELDS)} FROM laps
+WHERE workout_id IN (SELECT value FROM json_each(?))
+ORDER BY workout_id, lap_num
+"""
+
+BEST_EFFORTS_QUERY = f"""
+SELECT b.effort, b.distance_m, MIN(b.seconds), b.workout_id
+FROM best_efforts b JOIN workouts w ON w.id = b.workout_id
+WHERE b.seconds IS NOT NULL AND w.starts >= ? AND {IS_RUN}
+GROUP BY b.effort
+"""
+
+# Threads reading the pages of a first sync. Their rate is set by rate_limiter
+FULL_SYNC_WORKERS = 8
+
+UPDATE_PLAN_QUERY = 'UPDATE plans SET content = ? WHERE wahoo_id = ?'
+DELETE_PLAN_QUERY = 'DELETE FROM plans WHERE wahoo_id = ?'
+
+def workouts_range_query(columns:str=WORKOUT_COLUMNS, since:bool=True, until:bool=True, descending:bool=False) -> str:
+    """Workouts starting in [since, until) ordered by start, with a parameter for each bound used."""
+
+    conditions = ['starts >= ?'] * since + ['starts < ?'] * until
+
+    query = f'SELECT {columns} FROM workouts'
+
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+
+    return query + f' ORDER BY starts {"DESC" if descending else "ASC"}'
+
 
 class DatabaseAPI:
 
     def __init__(self, db_file:str, logger:logging.Logger):
         self.db_file = db_file
         self.logger = logger
+        self.pool = get_connection_manager(db_file)
 
     def _create_workouts_table(self, cursor:sqlite3.Cursor):
 
@@ -36,6 +101,26 @@ class DatabaseAPI:
         );
         ''')
 
+    # Metrics of workout_summary exposed as columns : name -> JSON path. The summary stores them as strings
+    summary_metrics = {
+        'distance_m':'$.distance_accum',
+        'duration_s':'$.duration_active_accum',
+        'speed_avg':'$.speed_avg',
+    }
+
+    def _add_summary_metric_columns(self, cursor:sqlite3.Cursor):
+        """
+        Add the summary metrics to the workouts table as virtual generated columns, computed
+        by SQLite from the JSON and kept up to date on every write. Safe to run on an
+        existing database : only missing columns are added.
+        """
+
+        existing = {row[1] for row in cursor.execute('PRAGMA table_xinfo(workouts)')}
+
+        for column, path in self.summary_metrics.items():
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE workouts ADD COLUMN {column} REAL GENERATED ALWAYS AS (CAST(json_extract(workout_summary, '{path}') AS REAL)) VIRTUAL")
+
     def _create_feedback_table(self, cursor:sqlite3.Cursor):
 
         cursor.execute('''
@@ -61,56 +146,258 @@ class DatabaseAPI:
         );
         ''')
 
+    def _create_laps_table(self, cursor:sqlite3.Cursor):
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS laps (
+            workout_id INT NOT NULL,
+            lap_num INT NOT NULL,
+            avg_speed REAL NULL,
+            total_distance REAL NULL,
+            total_elapsed_time REAL NULL,
+            total_descent INT NULL,
+            total_ascent INT NULL,
+            avg_grade REAL NULL,
+            PRIMARY KEY (workout_id, lap_num),
+            FOREIGN KEY (workout_id) REFERENCES workouts(id) ON DELETE CASCADE
+        );
+        ''')
+
+    def _create_best_efforts_table(self, cursor:sqlite3.Cursor):
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS best_efforts (
+            workout_id INT NOT NULL,
+            effort VARCHAR(10) NOT NULL,
+            distance_m REAL NOT NULL,
+            seconds REAL NULL,
+            PRIMARY KEY (workout_id, effort),
+            FOREIGN KEY (workout_id) REFERENCES workouts(id) ON DELETE CASCADE
+        );
+        ''')
+
+    def _create_training_load_table(self, cursor:sqlite3.Cursor):
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS training_load (
+            day DATE NOT NULL PRIMARY KEY,
+            load REAL NOT NULL,
+            atl REAL NOT NULL,
+            ctl REAL NOT NULL,
+            tsb REAL NOT NULL
+        );
+        ''')
+
+    def _create_rollup_tables(self, cursor:sqlite3.Cursor):
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weekly_rollup (
+            week DATE NOT NULL PRIMARY KEY,
+            distance_m REAL NOT NULL,
+            duration_s REAL NOT NULL,
+            runs INT NOT NULL,
+            longest_m REAL NOT NULL,
+            rpe_avg REAL NULL,
+            rpe_count INT NOT NULL
+        );
+        ''')
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_rollup (
+            month VARCHAR(7) NOT NULL PRIMARY KEY,
+            distance_m REAL NOT NULL,
+            duration_s REAL NOT NULL,
+            runs INT NOT NULL,
+            longest_m REAL NOT NULL,
+            rpe_avg REAL NULL,
+            rpe_count INT NOT NULL
+        );
+        ''')
+
+    def _create_sync_state_table(self, cursor:sqlite3.Cursor):
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name VARCHAR(50) NOT NULL PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        ''')
+
     def _create_all_tables(self):
 
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        with self.pool.transaction() as cursor:
+
+            self._create_workouts_table(cursor)
+            self._add_summary_metric_columns(cursor)
+            self._create_feedback_table(cursor)
+            self._create_plan_table(cursor)
+            self._create_laps_table(cursor)
+            self._create_best_efforts_table(cursor)
+            self._create_training_load_table(cursor)
+            self._create_rollup_tables(cursor)
+            self._create_sync_state_table(cursor)
+            self._create_indexes(cursor)
+
+            # Databases created before the rollups get them filled once
+            if cursor.execute('SELECT 1 FROM workouts LIMIT 1').fetchone() and not cursor.execute('SELECT 1 FROM weekly_rollup LIMIT 1').fetchone():
+                self.rebuild_rollups()
+
+    def _create_indexes(self, cursor:sqlite3.Cursor):
+
+        # Serves ORDER BY starts DESC LIMIT n and MAX(starts) without scanning the table
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_workouts_starts ON workouts (starts)')
+        # Covers the aggregates over a date range, which then never read nor parse the JSON
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_workouts_starts_metrics ON workouts (starts, distance_m, duration_s)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedback_workout_id ON feedback (workout_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_plans_wahoo_id ON plans (wahoo_id)')
+        # Walks each effort's times in order, for the fastest effort of each distance
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_best_efforts_effort_seconds ON best_efforts (effort, seconds)')
+
+    # Queries that must keep using an index as the tables grow : (name, query, example parameters)
+    hot_queries = [
+        ('recent workouts', RECENT_WORKOUTS_QUERY, (5,)),
+        ('recent workouts with feedback', RECENT_WORKOUTS_WITH_FEEDBACK_QUERY, (5,)),
+        ('most recent start', MOST_RECENT_START_QUERY, ()),
+        ('most recent workout id', MOST_RECENT_WORKOUT_ID_QUERY, ()),
+        ('feedback of workouts', FEEDBACKS_OF_WORKOUTS_QUERY, ('[1]',)),
+        ('laps of workouts', LAPS_OF_WORKOUTS_QUERY, ('[1]',)),
+        ('best efforts', BEST_EFFORTS_QUERY, ('',)),
+        ('workouts between dates', workouts_range_query(), ('', '')),
+        ('update plan', UPDATE_PLAN_QUERY, ('', 1)),
+        ('delete plan', DELETE_PLAN_QUERY, (1,)),
+    ]
+
+    # Plan steps over a result the query already bounds, e.g. the LIMIT of a subquery, allowed despite being scans or sorts
+    bounded_plan_steps = {
+        'recent workouts with feedback':('SCAN w', 'USE TEMP B-TREE FOR ORDER BY'),
+        'feedback of workouts':('USE TEMP B-TREE FOR RIGHT PART OF ORDER BY',),
+    }
+
+    def check_query_plans(self) -> dict[str, list[str]]:
+        """
+        Run EXPLAIN QUERY PLAN on every hot query and raise if one of them
+        falls back to a full table scan or to sorting the whole table.
+
+        Returns the plan details of each query.
+        """
+
+        conn = self.pool.connection()
+
+        plans = {}
+        regressions = []
+
+        for name, query, params in self.hot_queries:
+
+            details = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params)]
+            plans[name] = details
 
-        self._create_workouts_table(cursor)
-        self._create_feedback_table(cursor)
-        self._create_plan_table(cursor)
+            for detail in details:
+                # Scanning a virtual table such as json_each reads the parameters, not a table
+                full_scan = detail.startswith('SCAN ') and 'USING' not in detail and 'VIRTUAL TABLE' not in detail
+                if (full_scan or 'USE TEMP B-TREE' in detail) and detail not in self.bounded_plan_steps.get(name, ()):
+                    regressions.append(f'{name} : {detail}')
 
-        conn.commit()
-        conn.close()
+        if regressions:
+            raise RuntimeError(f'Hot queries are not using an index : {regressions}')
 
-    def update_workouts_table(self):
+        return plans
 
-        # Get most recent workout date
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+    def _sync_state(self, name:str) -> str|None:
 
-        query = "SELECT MAX(starts) FROM workouts"
-        response = cursor.execute(query)
-        most_recent_workout_date = response.fetchone()[0]
+        row = self.pool.connection().execute('SELECT value FROM sync_state WHERE name = ?', (name,)).fetchone()
 
-        wahoo = WahooAPI()
+        return row[0] if row else None
+
+    def _set_sync_state(self, name:str, value:str):
+
+        with self.pool.transaction() as cursor:
+            cursor.execute('INSERT INTO sync_state (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value', (name, value))
+
+    def update_workouts_table(self, wahoo:'WahooAPI|None'=None):
+
+        conn = self.pool.connection()
+
+        # Start date up to which every workout of the API is stored. Pages are stored newest first, so after
+        # a sync that failed midway MAX(starts) is past workouts that were never fetched : the watermark only
+        # moves once a sync completes. Databases synced before the watermark existed start from MAX(starts)
+        most_recent_workout_date = self._sync_state('workouts_synced_until') or conn.execute(MOST_RECENT_START_QUERY).fetchone()[0]
+
+        wahoo = wahoo or WahooAPI()
+
+        # The FIT decoding workers are forked before the page prefetching and download threads start
+        get_parse_pool()
 
         # If the table was empty get all workouts
         if most_recent_workout_date is None:
-            workouts_to_upload_locally = wahoo.read_workouts()
+            pages = [wahoo.read_workouts(max_workers=FULL_SYNC_WORKERS)]
         # If there was at least one workout
         else:
-            # Add one minute to not bring the most recent from the API
-            # and prevent a unique ID error on the database
+            # Only the workouts strictly after the watermark are streamed. Those already stored
+            # by a failed sync are fetched again and upserted
 
             most_recent_workout_date = datetime.fromisoformat(most_recent_workout_date)
 
-            workouts_to_upload_locally = wahoo.read_workouts(after=most_recent_workout_date)
+            pages = wahoo.iter_workouts(after=most_recent_workout_date)
         
-        # Add them to the database
+        # Add them to the database page by page, while the next page is being fetched
+
+        num_uploaded = 0
+        oldest_start = None
+
+        for workouts_to_upload_locally in pages:
+
+            self.logger.info(f'Uploading {len(workouts_to_upload_locally)} workouts to database : after {most_recent_workout_date}')
+
+            self.upload_workouts(workouts_to_upload_locally, rejected=wahoo.pop_rejected())
+
+            self.store_workouts_laps(workouts_to_upload_locally)
 
-        self.logger.info(f'Uploading {len(workouts_to_upload_locally)} workouts to database : after {most_recent_workout_date}')
+            self.store_workouts_streams(workouts_to_upload_locally)
 
-        for workout in workouts_to_upload_locally:
-            try: 
-                self.upload_workout(workout, cursor)
-            except sqlite3.Error as e:
-                self.logger.error(f'Failed to upload workout with id {workout.id} : {e}')
-            else:
-                self.logger.info(f'Succesfully uploaded workout')
+            self.store_best_efforts([w.id for w in workouts_to_upload_locally])
 
-        conn.commit()
-        conn.close()
+            num_uploaded += len(workouts_to_upload_locally)
+            page_oldest_start = min((w.starts for w in workouts_to_upload_locally), default=None)
+
+            if page_oldest_start and (oldest_start is None or page_oldest_start < oldest_start):
+                oldest_start = page_oldest_start
+
+        # Pages where every workout was rejected yield nothing to upload
+        if rejected := wahoo.pop_rejected():
+            self.logger.error(f'Failed to upload {len(rejected)} workouts : {rejected}')
+
+        self.logger.info(f'Synced {num_uploaded} workouts')
+
+        # Reached only when every page was stored
+        if (synced_until := conn.execute(MOST_RECENT_START_QUERY).fetchone()[0]) is not None:
+            self._set_sync_state('workouts_synced_until', synced_until)
+
+        # Only recompute the days from the oldest new workout onwards
+        if oldest_start:
+            self.update_training_load(oldest_start.date())
+        else:
+            self.update_training_load()
+
+    @staticmethod
+    def _workout_to_row(workout:WorkoutData) -> tuple:
+
+        if workout.workout_summary is not None and not isinstance(workout.workout_summary, dict):
+            raise TypeError(f'workout_summary must be a dict, got {type(workout.workout_summary).__name__}')
+
+        return (
+            workout.id,
+            workout.starts.strftime('%Y-%m-%dT%H:%M:%S.000+00:00'),  # Convert datetime to ISO 8601 string
+            workout.minutes,
+            workout.name,
+            workout.plan_id,
+            workout.route_id,
+            workout.workout_token,
+            workout.workout_type_id,
+            workout.day_code,
+            json.dumps(workout.workout_summary) if workout.workout_summary else None,  # Convert dict to string (JSON)
+            workout.created_at.strftime('%Y-%m-%dT%H:%M:%S.000+00:00'),
+            workout.updated_at.strftime('%Y-%m-%dT%H:%M:%S.000+00:00')
+        )
 
     def upload_workout(self, workout:WorkoutData, cursor:sqlite3.Cursor):
         
@@ -121,164 +408,730 @@ class DatabaseAPI:
         ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
 
-        cursor.execute(insert_query, (
-            workout.id,
-                workout.starts.strftime('%Y-%m-%dT%H:%M:%S.000+00:00'),  # Convert datetime to ISO 8601 string
-                workout.minutes,
-                workout.name,
-                workout.plan_id,
-                workout.route_id,
-                workout.workout_token,
-                workout.workout_type_id,
-                workout.day_code,
-                json.dumps(workout.workout_summary) if workout.workout_summary else None,  # Convert dict to string (JSON)
-                workout.created_at.strftime('%Y-%m-%dT%H:%M:%S.000+00:00'),
-                workout.updated_at.strftime('%Y-%m-%dT%H:%M:%S.000+00:00')
-        )
-        )
+        cursor.execute(insert_query, self._workout_to_row(workout))
+
+    @staticmethod
+    def _stored_starts(cursor:sqlite3.Cursor, workout_ids:list[int]) -> list[str]:
+        # Start dates of the workouts already stored : an upsert that moves one must refresh its old week and month too
+        query = 'SELECT starts FROM workouts WHERE id IN (SELECT value FROM json_each(?))'
+        return [row[0] for row in cursor.execute(query, (json.dumps(workout_ids),))]
+
+    def upload_workouts(self, workouts:list[WorkoutData], chunk_size:int=500, rejected:dict|None=None) -> dict:
+        """
+        Upsert workouts with one executemany per chunk, each chunk in its own transaction.
+
+        Rows that cannot be converted or written are collected and logged together, with
+        the workouts of the API pages that failed validation (rejected, id -> error).
+        Returns the number of rows written, the number of chunks and the failed ids with their error.
+        """
+
+        upsert_query = """
+        INSERT INTO workouts (
+            id, starts, minutes, name, plan_id, route_id, workout_token,
+            workout_type_id, day_code, workout_summary, created_at, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            starts = excluded.starts,
+            minutes = excluded.minutes,
+            name = excluded.name,
+            plan_id = excluded.plan_id,
+            route_id = excluded.route_id,
+            workout_token = excluded.workout_token,
+            workout_type_id = excluded.workout_type_id,
+            day_code = excluded.day_code,
+            workout_summary = excluded.workout_summary,
+            created_at = excluded.created_at,
+            updated_at = excluded.updated_at
+        """
+
+        rows = []
+        failed = dict(rejected or {})
+
+        for workout in workouts:
+            try:
+                rows.append(self._workout_to_row(workout))
+            except (TypeError, ValueError, AttributeError) as e:
+                failed[getattr(workout, 'id', None)] = str(e)
+
+        written = 0
+        num_chunks = 0
+
+        for start in range(0, len(rows), chunk_size):
+
+            chunk = rows[start:start+chunk_size]
+            num_chunks += 1
+            chunk_start_time = time.perf_counter()
+
+            try:
+                with self.pool.transaction() as cursor:
+                    previous_starts = self._stored_starts(cursor, [row[0] for row in chunk])
+                    cursor.executemany(upsert_query, chunk)
+                    self._refresh_rollups(cursor, [row[1] for row in chunk] + previous_starts)
+                chunk_written = len(chunk)
+            except sqlite3.Error:
+                # The chunk was rolled back : write it row by row to isolate the bad rows
+                chunk_written = 0
+                with self.pool.transaction() as cursor:
+                    previous_starts = self._stored_starts(cursor, [row[0] for row in chunk])
+                    for row in chunk:
+                        try:
+                            cursor.execute(upsert_query, row)
+                        except sqlite3.Error as e:
+                            failed[row[0]] = str(e)
+                        else:
+                            chunk_written += 1
+
+                    self._refresh_rollups(cursor, [row[1] for row in chunk if row[0] not in failed] + previous_starts)
+
+            written += chunk_written
+            elapsed_ms = (time.perf_counter() - chunk_start_time) * 1000
+
+            self.logger.info(f'Chunk #{num_chunks} : wrote {chunk_written}/{len(chunk)} workouts in {elapsed_ms:0.1f}ms')
+
+        if failed:
+            self.logger.error(f'Failed to upload {len(failed)} workouts : {failed}')
+
+        self.logger.info(f'Succesfully uploaded {written} workouts in {num_chunks} chunks')
+
+        return {'written':written, 'chunks':num_chunks, 'failed':failed}
         
+    def _store_laps(self, workout_id:int, laps_values:list[dict], cursor:sqlite3.Cursor):
+
+        columns = list(LAP_FIELDS)
+
+        insert_query = f"""
+        INSERT OR REPLACE INTO laps (workout_id, lap_num, {', '.join(columns)})
+        VALUES (?, ?, {', '.join('?' for _ in columns)})
+        """
+
+        cursor.executemany(insert_query, [
+            (workout_id, lap_num, *(lap_values.get(c) for c in columns))
+            for lap_num, lap_values in enumerate(laps_values, start=1)
+        ])
+
+    def store_workouts_laps(self, workouts:list[WorkoutData]):
+        """
+        Download (through the FIT cache) and parse the FIT file of each workout
+        and store its laps, so reports never parse FIT files while building a prompt.
+
+        Returns the lap values of the workouts whose laps were stored, by workout id.
+        """
+
+        if not workouts:
+            return {}
+
+        failed = {}
+        stored = {}
+
+        # Downloaded and parsed before the transaction, which would hold the write lock meanwhile
+        for workout, laps_values in zip(workouts, fetch_lap_values(workouts)):
+
+            if isinstance(laps_values, (KeyError, TypeError)):
+                # Workout without a FIT file
+                continue
+            elif isinstance(laps_values, Exception):
+                failed[workout.id] = str(laps_values)
+                continue
+
+            stored[workout.id] = laps_values
+
+        with self.pool.transaction() as cursor:
+            for workout_id, laps_values in stored.items():
+                self._store_laps(workout_id, laps_values, cursor)
+
+        if failed:
+            self.logger.error(f'Failed to store laps of {len(failed)} workouts : {failed}')
+
+        self.logger.info(f'Stored laps of {len(stored)} workouts')
+
+        return stored
+
+    def store_workouts_streams(self, workouts:list[WorkoutData]):
+        """
+        Convert the records of each workout's FIT file into columnar arrays in the
+        record store, decoding the files in the shared process pool. Already converted workouts are skipped.
+        """
+
+        to_convert = []
+
+        for workout in workouts:
+            try:
+                url = workout._fit_file_url
+            except (KeyError, TypeError):
+                # Workout without a FIT file
+                continue
+
+            if not record_store.has(workout.id):
+                to_convert.append((workout.id, url))
+
+        if not to_convert:
+            return
+
+        failed = {}
+
+        futures = {workout_id:submit_parse(convert_workout_records, workout_id, url, record_store.root_dir) for workout_id, url in to_convert}
+
+        for workout_id, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                failed[workout_id] = str(e)
+
+        if failed:
+            self.logger.error(f'Failed to store record streams of {len(failed)} workouts : {failed}')
+
+        self.logger.info(f'Stored record streams of {len(to_convert) - len(failed)} workouts')
+
+    def store_best_efforts(self, workout_ids:list[int]|None=None):
+        """
+        Compute and cache the best efforts of runs from their record streams.
+
+        Without workout_ids, every run of the record store that has no cached
+        best efforts is processed, which backfills the whole history once.
+        """
+
+        conn = self.pool.connection()
+
+        if workout_ids is None:
+            workout_ids = record_store.workout_ids()
+
+        done = {r[0] for r in conn.execute('SELECT DISTINCT workout_id FROM best_efforts')}
+        runs = {r[0] for r in conn.execute(f'SELECT w.id FROM workouts AS w WHERE {IS_RUN}')}
+
+        rows = []
+
+        for workout_id in workout_ids:
+
+            if workout_id in done or workout_id not in runs or not record_store.has(workout_id):
+                continue
+
+            streams = record_store.load(workout_id)
+
+            for effort, seconds in best_efforts(streams['elapsed'], streams['distance']).items():
+                rows.append((workout_id, effort, BEST_EFFORT_DISTANCES[effort], seconds))
+
+        if rows:
+            with self.pool.transaction() as cursor:
+                cursor.executemany('INSERT OR REPLACE INTO best_efforts (workout_id, effort, distance_m, seconds) VALUES (?, ?, ?, ?)', rows)
+
+        self.logger.info(f'Stored best efforts of {len({r[0] for r in rows})} workouts')
+
+    def get_best_efforts(self, since:datetime|None=None) -> dict[str, dict]:
+        """Return the fastest cached effort of each distance over runs, optionally only for those starting after since."""
+
+        conn = self.pool.connection()
+
+        since = since.strftime('%Y-%m-%dT%H:%M:%S.000+00:00') if since else ''
+
+        return {
+            effort:{'distance_m':distance_m, 'seconds':seconds, 'workout_id':workout_id}
+            for effort, distance_m, seconds, workout_id in conn.execute(BEST_EFFORTS_QUERY, (since,))
+        }
+
+    def _estimate_threshold_speed(self) -> float:
+
+        # The best 10k of the last 6 months is close to the pace that can be held for an hour
+        effort = self.get_best_efforts(since=datetime.now(UTC) - timedelta(days=180)).get('10k')
+
+        if effort is None:
+            return DEFAULT_THRESHOLD_SPEED
+
+        return effort['distance_m'] / effort['seconds']
+
+    def update_training_load(self, from_day:date|None=None, threshold_speed:float|None=None):
+        """
+        Extend the daily ATL/CTL/TSB series up to today.
+
+        Days before from_day are kept and the series continues from the last of them,
+        so a sync only recomputes the days of its new workouts onwards.
+        """
+
+        conn = self.pool.connection()
+
+        last_day = conn.execute('SELECT MAX(day) FROM training_load').fetchone()[0]
+
+        if last_day is not None:
+            next_day = date.fromisoformat(last_day) + timedelta(days=1)
+            from_day = min(from_day, next_day) if from_day else next_day
+        elif from_day is None:
+            first_start = conn.execute('SELECT MIN(starts) FROM workouts').fetchone()[0]
+            if first_start is None:
+                return
+            from_day = datetime.fromisoformat(first_start).date()
+
+        today = datetime.now(UTC).date()
+
+        if from_day > today:
+            return
+
+        threshold_speed = threshold_speed or self._estimate_threshold_speed()
+
+        previous = conn.execute('SELECT atl, ctl FROM training_load WHERE day < ? ORDER BY day DESC LIMIT 1', (from_day.isoformat(),)).fetchone()
+        atl, ctl = previous if previous else (0.0, 0.0)
+
+        loads = [0.0] * ((today - from_day).days + 1)
+
+        columns = ('starts', 'minutes', 'workout_summary', 'workout_type_id')
+
+        for starts, minutes, summary, workout_type_id in self.iter_workouts(since=from_day, columns=columns):
+            day = datetime.fromisoformat(starts).date()
+            # The load is scored against a running threshold pace, so other activities are left out
+            if day <= today and workout_type_id in RUNNING_WORKOUT_TYPES:
+                loads[(day - from_day).days] += workout_load(minutes, json.loads(summary) if summary else None, threshold_speed)
+
+        rows = [(day.isoformat(), load, atl_, ctl_, tsb) for day, load, atl_, ctl_, tsb in ewma_series(from_day, loads, atl, ctl)]
+
+        with self.pool.transaction() as cursor:
+            cursor.execute('DELETE FROM training_load WHERE day >= ?', (from_day.isoformat(),))
+            cursor.executemany('INSERT INTO training_load (day, load, atl, ctl, tsb) VALUES (?, ?, ?, ?, ?)', rows)
+
+        self.logger.info(f'Updated training load from {from_day} ({len(rows)} days)')
+
+    def get_training_load_summary(self) -> dict|None:
+        """Latest fatigue (ATL), fitness (CTL) and form (TSB), with the load of the last week and the fitness trend over 4 weeks."""
+
+        conn = self.pool.connection()
+
+        latest = conn.execute('SELECT day, atl, ctl, tsb FROM training_load ORDER BY day DESC LIMIT 1').fetchone()
+
+        if latest is None:
+            return None
+
+        day, atl, ctl, tsb = latest
+
+        week_start = (date.fromisoformat(day) - timedelta(days=6)).isoformat()
+        week_load = conn.execute('SELECT SUM(load) FROM training_load WHERE day >= ?', (week_start,)).fetchone()[0]
+
+        four_weeks_ago = (date.fromisoformat(day) - timedelta(days=28)).isoformat()
+        previous = conn.execute('SELECT ctl FROM training_load WHERE day <= ? ORDER BY day DESC LIMIT 1', (four_weeks_ago,)).fetchone()
+
+        return {
+            'day':day,
+            'atl':atl,
+            'ctl':ctl,
+            'tsb':tsb,
+            'week_load':week_load,
+            'ctl_change_4_weeks':ctl - previous[0] if previous else None
+        }
+
+    # Rollup tables : table -> (key column, SQL key of a start date)
+    rollups = {
+        'weekly_rollup':('week', "date(starts, '-6 days', 'weekday 1')"), # Monday of the ISO week
+        'monthly_rollup':('month', "strftime('%Y-%m', starts)"),
+    }
+
+    @staticmethod
+    def _period_bounds(table:str, day:date) -> tuple[date, date]:
+        """First day of the rollup period of day, and first day of the next period."""
+
+        if table == 'weekly_rollup':
+            start = day - timedelta(days=day.weekday())
+            return start, start + timedelta(weeks=1)
+
+        start = day.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+
+    @staticmethod
+    def _rollup_key(table:str, day:date) -> str:
+        return day.isoformat() if table == 'weekly_rollup' else day.strftime('%Y-%m')
+
+    def _fill_rollup(self, cursor:sqlite3.Cursor, table:str, since:date|None=None, until:date|None=None):
+        """(Re)compute the rows of a rollup table from the workouts starting in [since, until), or from all of them."""
+
+        key, key_sql = self.rollups[table]
+
+        conditions = [IS_RUN]
+        params = []
+
+        if since is not None:
+            conditions.append('w.starts >= ?')
+            params.append(since.isoformat())
+        if until is not None:
+            conditions.append('w.starts < ?')
+            params.append(until.isoformat())
+
+        where = f'WHERE {" AND ".join(conditions)}'
+
+        # The RPE of a workout is the one of its latest feedback
+        cursor.execute(f"""
+        INSERT OR REPLACE INTO {table} ({key}, distance_m, duration_s, runs, longest_m, rpe_avg, rpe_count)
+        SELECT {key_sql} AS period, COALESCE(SUM(distance_m), 0), COALESCE(SUM(duration_s), 0), COUNT(*),
+               COALESCE(MAX(distance_m), 0), AVG(rpe), COUNT(rpe)
+        FROM (
+            SELECT w.starts, w.distance_m, w.duration_s,
+                   (SELECT f.rpe FROM feedback AS f WHERE f.workout_id = w.id ORDER BY f.id DESC LIMIT 1) AS rpe
+            FROM workouts AS w {where}
+        )
+        GROUP BY period
+        """, params)
+
+    def _refresh_rollups(self, cursor:sqlite3.Cursor, starts:list[str]):
+        """Recompute the weeks and months spanned by the given start dates, in the caller's transaction."""
+
+        if not starts:
+            return
+
+        days = [datetime.fromisoformat(s).date() for s in starts]
+
+        for table, (key, _) in self.rollups.items():
+
+            since = self._period_bounds(table, min(days))[0]
+            until = self._period_bounds(table, max(days))[1]
+
+            # Periods of the range left without workouts must not keep their old row
+            cursor.execute(f'DELETE FROM {table} WHERE {key} >= ? AND {key} < ?', (self._rollup_key(table, since), self._rollup_key(table, until)))
+
+            self._fill_rollup(cursor, table, since, until)
+
+    def rebuild_rollups(self):
+        """Recompute every weekly and monthly rollup from the workouts and feedback tables."""
+
+        start = time.perf_counter()
+
+        with self.pool.transaction() as cursor:
+            for table in self.rollups:
+                cursor.execute(f'DELETE FROM {table}')
+                self._fill_rollup(cursor, table)
+
+        self.logger.info(f'Rebuilt the weekly and monthly rollups in {(time.perf_counter() - start) * 1000:0.1f}ms')
+
+    def _volume(self, table:str, periods:list[date]) -> list[dict]:
+
+        key, _ = self.rollups[table]
+        keys = [self._rollup_key(table, p) for p in periods]
+
+        conn = self.pool.connection()
+
+        query = f'SELECT {key}, distance_m, duration_s, runs, longest_m, rpe_avg FROM {table} WHERE {key} >= ? AND {key} <= ?'
+        rows = {row[0]:row[1:] for row in conn.execute(query, (keys[0], keys[-1]))}
+
+        volume = []
+
+        for period in keys:
+
+            distance, duration, runs, longest, rpe_avg = rows.get(period, (0.0, 0.0, 0, 0.0, None))
+
+            volume.append({
+                key:period,
+                'distance_km':distance / 1000,
+                'duration_min':duration / 60,
+                'runs':runs,
+                'longest_km':longest / 1000,
+                'avg_speed':distance / duration if distance and duration else None, # m/s
+                'rpe_avg':rpe_avg
+            })
+
+        return volume
+
+    def weekly_volume(self, weeks:int=12, until:date|None=None) -> list[dict]:
+        """
+        Distance, time, number of runs, longest run and average RPE of each ISO week
+        (Monday to Sunday, UTC), oldest first, for the weeks ending with the one of until
+        (today by default). Read from the weekly rollup, with zeros for weeks without runs.
+        """
+
+        until = until or datetime.now(UTC).date()
+        last_monday = until - timedelta(days=until.weekday())
+
+        return self._volume('weekly_rollup', [last_monday - timedelta(weeks=i) for i in reversed(range(weeks))])
+
+    def monthly_volume(self, months:int=6, until:date|None=None) -> list[dict]:
+        """Same as weekly_volume for calendar months, read from the monthly rollup."""
+
+        month = (until or datetime.now(UTC).date()).replace(day=1)
+        periods = [month]
+
+        for _ in range(months - 1):
+            month = (month - timedelta(days=1)).replace(day=1)
+            periods.append(month)
+
+        return self._volume('monthly_rollup', periods[::-1])
+
+    def get_workouts_laps(self, workouts:list[WorkoutData]) -> dict[int, list[dict]]:
+        """
+        Return the formatted laps of each workout. Laps that were not stored at sync
+        time are fetched and parsed concurrently, then stored.
+        """
+
+        conn = self.pool.connection()
+
+        columns = list(LAP_FIELDS)
+        ids = [w.id for w in workouts]
+
+        laps = {id_:[] for id_ in ids}
+
+        if ids:
+            for row in conn.execute(LAPS_OF_WORKOUTS_QUERY, (json.dumps(ids),)):
+                laps[row[0]].append(format_lap(dict(zip(columns, row[1:]))))
+
+        missing = [w for w in workouts if not laps[w.id]]
+
+        for workout_id, laps_values in self.store_workouts_laps(missing).items():
+            laps[workout_id] = [format_lap(lap_values) for lap_values in laps_values]
+
+        return laps
+
     def get_recent_workouts_data(self, num:int=5) -> list[WorkoutData]:
 
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
-        query = f'SELECT * FROM workouts ORDER BY starts DESC LIMIT {num}'
-
-        result = cursor.execute(query).fetchall()
-
-        conn.close()
-
-        workouts = [
-            WorkoutData(**{
-                    'id': r[0],
-                    'starts': r[1],
-                    'minutes': r[2],
-                    'name': r[3],
-                    'plan_id': r[4],
-                    'route_id': r[5],
-                    'workout_token': r[6],
-                    'workout_type_id': r[7],
-                    'day_code': r[8],
-                    'workout_summary': json.loads(r[9]),
-                    'created_at': r[10],
-                    'updated_at': r[11]}
-                    ) 
-            for r in result
-            ]
-        
+        conn = self.pool.connection()
 
-        return workouts
+        result = conn.execute(RECENT_WORKOUTS_QUERY, (num,)).fetchall()
 
-    def add_feedback_most_recent_workout(self, rpe:int, msg:str):
+        # Rows were validated when inserted, so they skip validation
+        return [WorkoutData.from_db_row(r) for r in result]
+
+    @staticmethod
+    def _starts_bound(value:datetime|date) -> str:
+        """Bound comparable with the stored start dates : a date, or a datetime converted to UTC."""
 
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        if not isinstance(value, datetime):
+            return value.isoformat()
+
+        if value.tzinfo is not None:
+            value = value.astimezone(UTC)
+
+        return value.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + '+00:00'
+
+    def iter_workouts(self, since:datetime|date|None=None, until:datetime|date|None=None, columns:tuple[str, ...]|None=None,
+                      batch_size:int=500, descending:bool=False) -> Iterator[WorkoutData|tuple]:
+        """
+        Yield the workouts that start in [since, until), oldest first unless descending,
+        reading batch_size rows at a time so any history is read in constant memory.
+
+        Without columns, workouts are yielded as WorkoutData. With columns, only those
+        columns are read and each workout is a tuple of their values. The summary metrics
+        (distance_m, duration_s, speed_avg) can be read without the JSON summary.
+        """
 
-        query = "SELECT id FROM workouts WHERE starts = (SELECT MAX(starts) FROM workouts)"
-        response = cursor.execute(query)
-        most_recent_workout_id = response.fetchone()[0]
+        if columns is not None:
+            unknown = set(columns) - set(WORKOUT_COLUMNS.split(', ')) - set(self.summary_metrics)
+            if unknown or not columns:
+                raise ValueError(f'Unknown workout columns : {sorted(unknown) or columns}')
 
-        self._add_feedback(most_recent_workout_id, rpe, msg)
+        params = [self._starts_bound(bound) for bound in (since, until) if bound is not None]
 
-        conn.commit()
-        conn.close()  
+        query = workouts_range_query(", ".join(columns) if columns else WORKOUT_COLUMNS, since is not None, until is not None, descending)
+
+        cursor = self.pool.connection().execute(query, params)
+
+        try:
+            while rows := cursor.fetchmany(batch_size):
+                if columns:
+                    yield from rows
+                else:
+                    yield from map(WorkoutData.from_db_row, rows)
+        finally:
+            cursor.close()
+
+    def add_feedback_most_recent_workout(self, rpe:int, msg:str):
+
+        # Both statements run in the same transaction on the thread's connection
+        with self.pool.transaction() as cursor:
+
+            response = cursor.execute(MOST_RECENT_WORKOUT_ID_QUERY)
+            most_recent_workout_id = response.fetchone()[0]
+
+            self._add_feedback(most_recent_workout_id, rpe, msg)
     
     def _add_feedback(self, workout_id:int, rpe:int, msg:str):
 
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
         insert_query = "INSERT INTO feedback (workout_id, rpe, feedback) VALUES (?, ?, ?)"
 
-        cursor.execute(insert_query, (workout_id, rpe, msg))
+        with self.pool.transaction() as cursor:
+            cursor.execute(insert_query, (workout_id, rpe, msg))
 
-        conn.commit()
-        conn.close()
+            # The RPE averages of the workout's week and month change with it
+            starts = cursor.execute('SELECT starts FROM workouts WHERE id = ?', (workout_id,)).fetchone()
+            if starts:
+                self._refresh_rollups(cursor, [starts[0]])
 
         self.logger.info(f'Added feedback to workout {workout_id}')
         
+    @staticmethod
+    def _feedback_entry(rpe:int|None, feedback:str|None, created_at:str|None) -> dict:
+        return {'rpe':rpe, 'feedback':feedback, 'created_at':created_at}
+
+    def get_feedbacks_from_workouts(self, workouts_id:Iterable[int]) -> dict[int, list[dict]]:
+        """
+        Return every feedback entry of each workout, latest first, with an empty list for
+        workouts without feedback. The ids are sent as one JSON array, so thousands of
+        them still make a single query.
+        """
+
+        workouts_id = list(dict.fromkeys(workouts_id))
+
+        feedbacks = {id_:[] for id_ in workouts_id}
+
+        if not workouts_id:
+            return feedbacks
+
+        conn = self.pool.connection()
+
+        for workout_id, rpe, feedback, created_at in conn.execute(FEEDBACKS_OF_WORKOUTS_QUERY, (json.dumps(workouts_id),)):
+            feedbacks[workout_id].append(self._feedback_entry(rpe, feedback, created_at))
+
+        return feedbacks
+
     def get_feedback_from_workouts(self, workouts_id:list[int])->dict[int, dict]:
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        """Return the latest feedback of each workout, with None values for workouts without feedback."""
 
-        placeholders = ', '.join('?' for _ in workouts_id)
-    
-        query = f'SELECT workout_id, rpe, feedback FROM feedback WHERE workout_id IN ({placeholders})'
-        query_results = cursor.execute(query, tuple(workouts_id))
-        
-        found = {r[0]:{'rpe':r[1], 'feedback':r[2]} for r in query_results}
+        no_feedback = {'rpe':None, 'feedback':None}
 
-        ids_with_feedback = list(found.keys())
-        not_found = {id_:{'rpe':None, 'feedback':None} for id_ in workouts_id if id_ not in ids_with_feedback}
+        return {
+            id_:{'rpe':entries[0]['rpe'], 'feedback':entries[0]['feedback']} if entries else dict(no_feedback)
+            for id_, entries in self.get_feedbacks_from_workouts(workouts_id).items()
+        }
 
-        conn.close()
+    def get_recent_workouts_with_feedback(self, num:int=5) -> list[tuple[WorkoutData, list[dict]]]:
+        """Return the most recent workouts, most recent first, each with all of its feedback entries latest first."""
 
-        found.update(not_found)
+        conn = self.pool.connection()
 
-        return found
+        workouts = {}
 
-    def add_plan(self, plan_as_b64:str, external_id:str, wahoo_id:int):
+        for row in conn.execute(RECENT_WORKOUTS_WITH_FEEDBACK_QUERY, (num,)):
+
+            workout_id = row[0]
 
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+            if workout_id not in workouts:
+                workouts[workout_id] = (WorkoutData.from_db_row(row[:12]), [])
+
+            if row[12] is not None: # rpe is NOT NULL, so None means no feedback row
+                workouts[workout_id][1].append(self._feedback_entry(*row[12:]))
+
+        return list(workouts.values())
+
+    def add_plan(self, plan_as_b64:str, external_id:str, wahoo_id:int):
 
         insert_query = 'INSERT INTO plans (content, external_id, wahoo_id) VALUES (?, ?, ?)'
 
         try:
-            cursor.execute(insert_query, (plan_as_b64, external_id, wahoo_id))
+            with self.pool.transaction() as cursor:
+                cursor.execute(insert_query, (plan_as_b64, external_id, wahoo_id))
         except Exception as e:
             self.logger.error(f'Failed to upload plan (id : {wahoo_id}) to local database : {e})')
             raise e
         else:
             self.logger.info(f'Succesfully added plan to local database')
 
-        conn.commit()
-        conn.close()
-
     def update_plan(self, plan_as_b64_str:str, wahoo_id:str):
 
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
-        update_query = f'UPDATE plans SET content = {plan_as_b64_str} WHERE wahoo_id = {wahoo_id}'
-
         try:
-            cursor.execute(update_query)
+            with self.pool.transaction() as cursor:
+                cursor.execute(UPDATE_PLAN_QUERY, (plan_as_b64_str, wahoo_id))
         except Exception as e:
             self.logger.error(f'Failed to update plan (id : {wahoo_id}) in local database : {e})')
             raise e
         else:
             self.logger.info(f'Succesfully updated plan in local database')
-
-        conn.commit()
-        conn.close()
         
     def delete_plan(self, wahoo_id:int):
 
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
-        delete_query = f'DELETE FROM plans WHERE wahoo_id = {wahoo_id}'
-
         try:
-            cursor.execute(delete_query)
+            with self.pool.transaction() as cursor:
+                cursor.execute(DELETE_PLAN_QUERY, (wahoo_id,))
         except Exception as e:
             self.logger.error(f'Failed to delete plan (id : {wahoo_id}) in local database : {e})')
             raise e
         else:
             self.logger.info(f'Succesfully deleted plan in local database.')
 
-        conn.commit()
-        conn.close()
 
 
+class WahooAPIBase:
 
-class WahooAPI:
+    """
+    Requests and answers of the Wahoo API, shared by WahooAPI and its asyncio version
+    async_connections.AsyncWahooAPI, which only differ in how the calls are sent.
+    """
 
-    def __init__(self):
+    def __init__(self, base_url:str='https://api.wahooligan.com/v1/', athlete:str='default', token_manager=token_manager):
         self.token_manager = token_manager
-        self.base_url = 'https://api.wahooligan.com/v1/'
-        
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self.athlete = athlete # Key of the athlete's rate limit buckets
+        self.rejected:dict[int|str, str] = {} # Invalid workouts of the pages read so far, see pop_rejected
+
+    def _limiter(self, call_class:str):
+        return self.rate_limiter.for_call(self.athlete, call_class)
+
+    @staticmethod
+    def _check_after(after:datetime|None):
+        if after:
+            # Prevent error of comparing naive tz (from after) with UTC time (from API)
+            assert after.timetz().tzinfo == UTC, 'After must be a datetime with UTC'
+
+    def _parse_page(self, data:dict) -> WorkoutEndpointResponseJSONModel:
+
+        page = WorkoutEndpointResponseJSONModel.from_page(data)
+
+        if page.rejected:
+            logger.error(f'Rejected {len(page.rejected)} invalid workouts of page {page.page} : {list(page.rejected)}')
+            self.rejected.update(page.rejected)
+
+        return page
+
+    def pop_rejected(self) -> dict[int|str, str]:
+        """Return and forget the workouts rejected by validation since the last call, id -> error."""
+
+        rejected, self.rejected = self.rejected, {}
+
+        return rejected
+
+    @staticmethod
+    def _has_more(page:WorkoutEndpointResponseJSONModel, num_seen:int, after:datetime|None) -> bool:
+        # Pages are ordered by descending start date : stop at the first one reaching after
+        return bool(
+            page.num_received
+            and num_seen < page.total
+            and (after is None or not page.workouts or page.lastest_starts_date_in_page > after)
+        )
+
+    @staticmethod
+    def _workouts_after(page:WorkoutEndpointResponseJSONModel, after:datetime|None) -> list[WorkoutData]:
+        return page.workouts if after is None else [w for w in page.workouts if w.starts > after]
+
+    @staticmethod
+    def _workout_for_today_payload(plan_id:int) -> dict:
+
+        date = datetime.now(UTC) + timedelta(minutes=3)
+        date = date.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+        return {
+            'workout[name]': "Today's workout",
+            'workout[workout_type_id]':1,
+            'workout[starts]':date,
+            'workout[workout_token]':str(uuid4()),
+            'workout[minutes]':50, # Set the actual time
+            'workout[plan_id]':plan_id
+        }
+
+    @staticmethod
+    def _plan_payload(plan_as_b64_str:str, external_id:str|None=None) -> dict:
+
+        payload = {
+            'plan[file]': 'data:application/json;base64,' + plan_as_b64_str,
+            'plan[provider_updated_at]':str(datetime.now(UTC))
+        }
+
+        if external_id:
+            payload['plan[external_id]'] = external_id
+
+        return payload
+
+    @staticmethod
+    def _check_response(response, failure:str, logger:logging.Logger=logger):
+        """raise_for_status, logging the body of error answers."""
+
+        try:
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f'{failure} : {response.text}')
+            raise e
+
+
+class WahooAPI(WahooAPIBase):
+
     @property
     def headers(self):
         return {'Authorization':f'Bearer {self.token_manager.get_access_token()}'}
@@ -288,199 +1141,170 @@ class WahooAPI:
 
         url = self.base_url + 'workouts'
 
-        response = requests.get(
+        response = http_client.get(
             url = url,
             headers=self.headers,
-            params={'page':page, 'per_page':per_page} # Per page high reduces the number of API calls required
+            params={'page':page, 'per_page':per_page}, # Per page high reduces the number of API calls required
+            limiter=self._limiter('read')
         )
 
         response.raise_for_status()
 
-        return WorkoutEndpointResponseJSONModel(**response.json())
+        return self._parse_page(response.json())
     
 
-    def read_workouts(self, after:datetime|None=None, per_page:int=50) -> list[WorkoutData]:
-        # After date is in UTC. After is strict
-
-        first_page = self._get_workouts_page(1, per_page=per_page)
+    def _get_workouts_pages(self, pages:list[int], per_page:int, max_workers:int) -> list[WorkoutEndpointResponseJSONModel]:
+        """
+        Fetch pages with a bounded pool of threads, returning them in the order of pages.
+        The requests are paced by the 'read' buckets of the rate limiter.
+        """
 
-        output = [w for w in first_page.workouts]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda page: self._get_workouts_page(page, per_page=per_page), pages))
 
-        total = first_page.total
+    def iter_workouts(self, after:datetime|None=None, per_page:int=50) -> Iterator[list[WorkoutData]]:
+        """
+        Yield the workouts strictly after the given UTC date (all of them without it),
+        one page at a time, most recent first.
 
-        if after:
-            # Get only workouts after the specified date
+        The next page is fetched in the background while the caller handles the
+        current one. Pages are ordered by descending start date, so the stream stops
+        at the first page whose oldest workout is at or before after.
+        """
 
-            # Prevent error of comparing naive tz (from after) with UTC time (from API)
-            assert after.timetz().tzinfo == UTC, 'Before must be a datetime with UTC'
+        self._check_after(after)
 
-            last_date_in_response = first_page.lastest_starts_date_in_page
+        with ThreadPoolExecutor(max_workers=1) as executor:
 
-            next_page_num = 2
+            page_num = 1
+            future = executor.submit(self._get_workouts_page, page_num, per_page)
+            num_seen = 0
 
-            # Only go to next page if there are more workouts that could be in the next page
-            # that means there are still unseen workouts in later pages that could have
-            # a date bafter the selected date
+            while future is not None:
 
-            while last_date_in_response >= after and len(output)<total:
-                
-                next_page = self._get_workouts_page(next_page_num, per_page=per_page)
+                page = future.result()
+                num_seen += page.num_received
 
-                last_date_in_response = next_page.lastest_starts_date_in_page
+                page_num += 1
+                future = executor.submit(self._get_workouts_page, page_num, per_page) if self._has_more(page, num_seen, after) else None
 
-                output.extend(next_page.workouts)
+                if workouts := self._workouts_after(page, after):
+                    yield workouts
 
-            return [w for w in output if w.starts>after]
+    def read_workouts(self, after:datetime|None=None, per_page:int=50, max_workers:int=1) -> list[WorkoutData]:
+        # After date is in UTC. After is strict
+        # With max_workers > 1, a full read fetches the pages after the first one concurrently
 
-        else:
+        if after or max_workers <= 1:
+            # Get only workouts after the specified date, or all of them one page after the other
+            return [w for page in self.iter_workouts(after=after, per_page=per_page) for w in page]
 
-            # Get all workouts
+        # Get all workouts
 
-            next_page_num = 2
+        first_page = self._get_workouts_page(1, per_page=per_page)
 
-            while total > len(output):
+        output = [w for w in first_page.workouts]
 
-                new_page = self._get_workouts_page(next_page_num, per_page=per_page)
+        # The first page tells how many pages there are
+        num_pages = math.ceil(first_page.total / per_page)
 
-                output.extend(new_page.workouts)
+        pages = self._get_workouts_pages(list(range(2, num_pages+1)), per_page, max_workers)
 
-                next_page_num +=1
+        for page in pages:
+            output.extend(page.workouts)
 
-            return output
+        return output
     
     def upload_workout_for_today(self, plan_id:int):
 
-        date = datetime.now(UTC) + timedelta(minutes=3)
-        date = date.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-
-        payload = {
-            'workout[name]': "Today's workout",
-            'workout[workout_type_id]':1,
-            'workout[starts]':date,
-            'workout[workout_token]':str(uuid4()),
-            'workout[minutes]':50, # Set the actual time
-            'workout[plan_id]':plan_id
-        }
-
         url = self.base_url + 'workouts'
 
-        response = requests.post(
+        response = http_client.post(
             url = url, 
             headers=self.headers,
-            params=payload
+            params=self._workout_for_today_payload(plan_id),
+            limiter=self._limiter('write')
         )
 
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            logger.error(f'Failed to upload workout to Wahoo server : {response.json()}')
-            raise e
-        else:
-            id_ = response.json()["id"]
-            logger.info(f'Uploaded to Wahoo server a new workout for today : id = {id_}.')
+        self._check_response(response, 'Failed to upload workout to Wahoo server')
+
+        id_ = response.json()["id"]
+        logger.info(f'Uploaded to Wahoo server a new workout for today : id = {id_}.')
 
     def update_plan(self, wahoo_id:int, plan_as_b64_str:str, db_file:str, logger:logging.Logger):
 
         assert False == True, 'Modify plan on local db not implemented yet'
 
         url = self.base_url + f'plans/{wahoo_id}'
-        
-        payload = {
-            'plan[file]': 'data:application/json;base64,' + plan_as_b64_str,
-            'plan[provider_updated_at]':datetime.now(UTC)
-        }
 
-        response = requests.post(
+        response = http_client.post(
             url=url,
             headers=self.headers,
-            params=payload
+            params=self._plan_payload(plan_as_b64_str),
+            limiter=self._limiter('write')
         )
 
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            logger.error(f'Failed to update plan on server : {e}')
-            raise e
-        else:
-            logger.info('Succesfully updated plan on Wahoo Server')
+        self._check_response(response, 'Failed to update plan on server', logger)
+
+        logger.info('Succesfully updated plan on Wahoo Server')
 
-            db = DatabaseAPI(db_file, logger)
-            db.update_plan(plan_as_b64_str, wahoo_id)
+        db = DatabaseAPI(db_file, logger)
+        db.update_plan(plan_as_b64_str, wahoo_id)
 
     def upload_plan(self, plan_as_b64_str:str, db:DatabaseAPI) -> int:
 
         external_id = str(uuid4())        
 
         url = self.base_url + 'plans'
-        
-        payload = {
-            'plan[file]': 'data:application/json;base64,' + plan_as_b64_str,
-            'plan[external_id]':external_id,
-            'plan[provider_updated_at]':datetime.now(UTC)
-        }
 
-        response = requests.post(
+        response = http_client.post(
             url=url,
             headers=self.headers,
-            params=payload
+            params=self._plan_payload(plan_as_b64_str, external_id),
+            limiter=self._limiter('write')
         )
 
-        try:
-            response.raise_for_status()
-        except Exception as e:
-
-            # Future change : handle loggers differently (separed or the same 
-            # for databaseAPI and wahooAPI ? )
+        self._check_response(response, 'Failed to upload new plan to server')
 
-            logger.error(f'Failed to upload new plan to server : {response.json()}')
-            raise e
-        else:
-            logger.info('Succesfully uploaded plan to Wahoo Server')
+        logger.info('Succesfully uploaded plan to Wahoo Server')
 
-            wahoo_id = response.json()['id']
+        wahoo_id = response.json()['id']
 
-            db.add_plan(plan_as_b64_str, external_id, wahoo_id)
+        db.add_plan(plan_as_b64_str, external_id, wahoo_id)
 
-            return wahoo_id
+        return wahoo_id
         
 
     def delete_plan(self, plan_id:int, db_file:str, logger:logging.Logger):
         
         url = self.base_url + f'plans/{plan_id}'
 
-        response = requests.delete(
+        response = http_client.delete(
             url=url, 
-            headers=self.headers
+            headers=self.headers,
+            limiter=self._limiter('write')
         )
 
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            logger.error(f'Failed to delete plan from server : {response.json()}')
-            raise e
-        else:
-            logger.info(f'Succesfully deleted plan from wahoo server.')
+        self._check_response(response, 'Failed to delete plan from server', logger)
+
+        logger.info(f'Succesfully deleted plan from wahoo server.')
 
-            db = DatabaseAPI(db_file=db_file, logger=logger)
+        db = DatabaseAPI(db_file=db_file, logger=logger)
 
-            db.delete_plan(plan_id)
+        db.delete_plan(plan_id)
 
     def delete_workout(self, workout_id:int):
         
         url = self.base_url + f'workouts/{workout_id}'
 
-        response = requests.delete(
+        response = http_client.delete(
             url=url, 
-            headers=self.headers
+            headers=self.headers,
+            limiter=self._limiter('write')
         )
 
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            logger.error(f'Failed to delete workout from server : {response.json()}')
-            raise e
-        else:
-            logger.info(f'Succesfully deleted workout from wahoo server.')
+        self._check_response(response, 'Failed to delete workout from server')
 
-            # db.delete_workout(plan_id)
+        logger.info(f'Succesfully deleted workout from wahoo server.')
 
+        # db.delete_workout(plan_id)
@@ -1,6 +1,6 @@
 import json
 from typing import Tuple
-from datetime import datetime, UTC
+from datetime import datetime, UTC, timedelta
 from pydantic import BaseModel, Field
 from connections import DatabaseAPI
 from utils import setup_logger, speed_to_pace
@@ -46,10 +46,34 @@ def read_goals_progress_deadline(params_file:str) -> Tuple[RunningParams, Runnin
 
     return goal, current_progress, deadline
 
+def derive_current_progress(db:DatabaseAPI, distance_m:float, days:int=90) -> RunningParams|None:
+    """
+    Current progress from the best efforts of the last days : the best effort at the
+    goal distance, or the longest shorter one. None if no best effort is available.
+    """
+
+    efforts = db.get_best_efforts(since=datetime.now(UTC) - timedelta(days=days))
+
+    candidates = [e for e in efforts.values() if e['distance_m'] <= distance_m * 1.01]
+
+    if not candidates:
+        return None
+
+    effort = max(candidates, key=lambda e: e['distance_m'])
+
+    seconds = int(round(effort['seconds']))
+    time = Time(hours=seconds // 3600, minutes=(seconds % 3600) // 60, seconds=seconds % 60)
+
+    return RunningParams(time=time, distance_m=effort['distance_m'])
+
 def generate_goal_context():
 
     goal, current_progress, deadline = read_goals_progress_deadline('params.json')
 
+    # Prefer the progress measured on recent workouts to the one written by hand
+    db = DatabaseAPI('db.sqlite3', logger=logger)
+    current_progress = derive_current_progress(db, goal.distance_m) or current_progress
+
     days_left = deadline - datetime.today()
     days_left = max(days_left.days, 0)
 
@@ -86,7 +110,7 @@ def read_plan_stucture(filename:str) -> dict:
 
     return data
 
-def generate_indiviual_workout_report(workout_data:WorkoutData, feedback_data:dict,detailed:bool=False, add_days_since:bool=False) -> str:
+def generate_indiviual_workout_report(workout_data:WorkoutData, feedback_data:dict,detailed:bool=False, add_days_since:bool=False, laps:list[dict]|None=None) -> str:
 
     msg = feedback_data.get('feedback')
     rpe = feedback_data.get('rpe')
@@ -99,8 +123,9 @@ def generate_indiviual_workout_report(workout_data:WorkoutData, feedback_data:di
         output=''
 
     if detailed:
-        # Called request and process the file
-        laps = workout_data.laps
+        # Use the laps stored at sync time, otherwise process the FIT file
+        if not laps:
+            laps = workout_data.laps
         output += '\n'
 
         for num, lap in enumerate(laps):
@@ -127,21 +152,35 @@ def generate_indiviual_workout_report(workout_data:WorkoutData, feedback_data:di
 
         return output
     
+def _combine_feedback(entries:list[dict]) -> dict:
+    """Feedback of a workout for its report : every message in the order given, and the latest RPE."""
+
+    if not entries:
+        return {'rpe':None, 'feedback':None}
+
+    messages = [e['feedback'] for e in reversed(entries) if e['feedback']]
+
+    return {'rpe':entries[0]['rpe'], 'feedback':' / '.join(messages) or None}
+
 def generate_recent_workouts_summaries():
 
     db = DatabaseAPI('db.sqlite3', logger=logger)
-    recent_workouts = db.get_recent_workouts_data(5)
-    ids = [w.id for w in recent_workouts]
+    # Workouts and all their feedback in one query
+    recent_workouts_with_feedback = db.get_recent_workouts_with_feedback(5)
+    recent_workouts = [w for w, _ in recent_workouts_with_feedback]
 
-    feedbacks = db.get_feedback_from_workouts(ids)
+    feedbacks = {w.id:_combine_feedback(entries) for w, entries in recent_workouts_with_feedback}
 
     most_recent_workout = recent_workouts.pop(0)
+    # Only the most recent workout gets a detailed report
+    most_recent_workout_laps = db.get_workouts_laps([most_recent_workout])[most_recent_workout.id]
 
     most_recent_wk_summary = generate_indiviual_workout_report(
         most_recent_workout, 
         feedback_data=feedbacks[most_recent_workout.id], 
         detailed=True, 
-        add_days_since=True
+        add_days_since=True,
+        laps=most_recent_workout_laps
     )
 
     other_summaries = [generate_indiviual_workout_report(w, feedbacks[w.id], add_days_since=True) for w in recent_workouts[1:]]
@@ -149,11 +188,52 @@ def generate_recent_workouts_summaries():
 
     return most_recent_wk_summary + '\nOlder workouts :\n' + other_summaries
 
-def generate_user_prompt():
-    additional_info = input('Any addtional information for today\'s workout: ')
+def generate_training_load_context() -> str:
+
+    db = DatabaseAPI('db.sqlite3', logger=logger)
+    summary = db.get_training_load_summary()
+
+    if summary is None:
+        return ''
+
+    output = (
+        f'My training load : fitness (CTL) {summary["ctl"]:0.0f}, fatigue (ATL) {summary["atl"]:0.0f}, '
+        f'form (TSB) {summary["tsb"]:0.0f}, load of the last 7 days {summary["week_load"]:0.0f}.'
+    )
+
+    if summary['ctl_change_4_weeks'] is not None:
+        output += f' Fitness changed by {summary["ctl_change_4_weeks"]:+0.0f} over the last 4 weeks.'
+
+    return output
+
+def generate_volume_context(weeks:int=4) -> str:
+
+    db = DatabaseAPI('db.sqlite3', logger=logger)
+
+    lines = []
+
+    for week in db.weekly_volume(weeks):
+        line = f'- Week of {week["week"]} : {week["distance_km"]:0.1f}km in {week["runs"]} runs ({week["duration_min"]:0.0f}min)'
+        if week['runs']:
+            line += f', longest run {week["longest_km"]:0.1f}km'
+        if week['rpe_avg'] is not None:
+            line += f', average RPE {week["rpe_avg"]:0.1f}/10'
+        lines.append(line)
+
+    return f'My running volume over the last {weeks} weeks :\n' + '\n'.join(lines)
+
+def ask_additional_info() -> str:
+    return input('Any addtional information for today\'s workout: ')
+
+def generate_user_prompt(additional_info:str|None=None):
+
+    if additional_info is None:
+        additional_info = ask_additional_info()
 
     output = additional_info
     output += '\nHere are some of my previous workouts data:\n' + generate_recent_workouts_summaries()
+    output += '\n' + generate_training_load_context()
+    output += '\n' + generate_volume_context()
     output += '\n' + generate_goal_context()
     output += '\n' + generate_week_context(1)
 
@@ -0,0 +1,239 @@
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, UTC, timedelta
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from synthetic import synthetic_fit_file, synthetic_workout
+
+# Local stand-in for api.wahooligan.com, to measure syncs and uploads without the real API
+
+
+@lru_cache(maxsize=16)
+def _fit_file(seconds:int) -> bytes:
+    return synthetic_fit_file(seconds=seconds)
+
+
+class FakeWahooState:
+
+    """
+    Synthetic workout history, most recent first, plus the plans and workouts created
+    through the API. Historical workouts are generated from their index on demand, so a
+    history of 100k workouts costs no memory.
+    """
+
+    def __init__(self, num_workouts:int, latest_start:datetime, interval:timedelta, with_fit_files:bool):
+        self.num_workouts = num_workouts
+        self.latest_start = latest_start
+        self.interval = interval
+        self.with_fit_files = with_fit_files
+        self.base_url = ''
+
+        self.added:list[dict] = [] # Workouts added after the history, oldest first
+        self.plans:dict[int, dict] = {}
+        self.requests:list[tuple[float, str, str]] = [] # (time.monotonic() at arrival, method, path) of every request
+        self.failing_pages:set[int] = set() # Pages of /v1/workouts answered with a 503, to interrupt syncs
+        self.next_id = num_workouts + 1
+        self.lock = threading.Lock()
+
+    def _workout(self, workout_id:int, starts:datetime, minutes:int) -> dict:
+        fit_file_url = f'{self.base_url}/files/{workout_id}-{minutes}.fit' if self.with_fit_files else None
+        return synthetic_workout(workout_id, starts, minutes, fit_file_url)
+
+    def _historical(self, index:int) -> dict:
+        # Index 0 is the most recent : ids grow with the start date
+        return self._workout(self.num_workouts - index, self.latest_start - index * self.interval, 30 + index % 60)
+
+    def add_workouts(self, num:int) -> list[dict]:
+        """Add num workouts more recent than all the others, as a device upload would."""
+
+        with self.lock:
+            new = []
+            latest = datetime.fromisoformat(self.added[-1]['starts'].replace('Z', '+00:00')) if self.added else self.latest_start
+            for _ in range(num):
+                latest += self.interval
+                new.append(self._workout(self.next_id, latest, 45))
+                self.next_id += 1
+
+            self.added.extend(new)
+
+            return new
+
+    def page(self, page:int, per_page:int) -> dict:
+
+        with self.lock:
+            added = self.added[::-1]
+
+        total = len(added) + self.num_workouts
+        start, end = (page - 1) * per_page, min(page * per_page, total)
+
+        workouts = [added[i] if i < len(added) else self._historical(i - len(added)) for i in range(start, end)]
+
+        return {'workouts':workouts, 'total':total, 'page':page, 'per_page':per_page, 'order':'descending', 'sort':'starts'}
+
+
+def make_handler(state:FakeWahooState, latency_s:float, jitter_s:float, error_rate:float, throttle_rate:float):
+
+    class FakeWahooHandler(BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1' # Keep-alive, like the real API
+        # Headers and body are separate writes : with Nagle's algorithm, delayed ACKs hold the body back about 40ms
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status:int, body:bytes=b'', content_type:str='application/json', headers:dict|None=None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status:int, data):
+            self._send(status, json.dumps(data).encode('utf-8'))
+
+        def _inject(self) -> bool:
+            """Simulate latency and failures. Returns True if an error was sent."""
+
+            time.sleep(latency_s + random.uniform(0, jitter_s))
+
+            draw = random.random()
+
+            if draw < throttle_rate:
+                self._json(429, {'error':'Too many requests'})
+                return True
+            if draw < throttle_rate + error_rate:
+                self._json(random.choice([500, 502, 503]), {'error':'Injected failure'})
+                return True
+
+            return False
+
+        def _route(self, method:str):
+
+            # Drain the body so the connection can be reused
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+
+            url = urlparse(self.path)
+            query = {k:v[0] for k, v in parse_qs(url.query).items()}
+
+            with state.lock:
+                state.requests.append((time.monotonic(), method, url.path))
+
+            if self._inject():
+                return
+
+            if method == 'GET' and url.path == '/v1/workouts' and int(query.get('page', 1)) in state.failing_pages:
+                self._json(503, {'error':'Injected page failure'})
+
+            elif method == 'GET' and url.path == '/v1/workouts':
+                self._json(200, state.page(int(query.get('page', 1)), int(query.get('per_page', 30))))
+
+            elif method == 'POST' and url.path == '/v1/workouts':
+                with state.lock:
+                    workout_id = state.next_id
+                    state.next_id += 1
+                self._json(201, {'id':workout_id, 'plan_id':query.get('workout[plan_id]')})
+
+            elif method == 'DELETE' and re.fullmatch(r'/v1/workouts/\d+', url.path):
+                self._send(204)
+
+            elif method == 'POST' and url.path == '/v1/plans':
+                with state.lock:
+                    plan_id = state.next_id
+                    state.next_id += 1
+                    state.plans[plan_id] = query
+                self._json(201, {'id':plan_id, 'external_id':query.get('plan[external_id]')})
+
+            elif method in ('POST', 'DELETE') and (match := re.fullmatch(r'/v1/plans/(\d+)', url.path)):
+                with state.lock:
+                    found = int(match.group(1)) in state.plans
+                    if found and method == 'DELETE':
+                        del state.plans[int(match.group(1))]
+                    elif found:
+                        state.plans[int(match.group(1))].update(query)
+                self._json(200, {'id':int(match.group(1))}) if found else self._json(404, {'error':'Not found'})
+
+            elif method == 'POST' and url.path == '/oauth/token':
+                self._json(200, {
+                    'access_token':f'access-{random.getrandbits(64):x}',
+                    'refresh_token':f'refresh-{random.getrandbits(64):x}',
+                    'expires_in':7200,
+                    'created_at':int(time.time())
+                })
+
+            elif method == 'GET' and (match := re.fullmatch(r'/files/(\d+)-(\d+)\.fit', url.path)):
+                self._send(200, _fit_file(int(match.group(2)) * 60), content_type='application/octet-stream')
+
+            else:
+                self._json(404, {'error':'Not found'})
+
+        def do_GET(self):
+            self._route('GET')
+
+        def do_POST(self):
+            self._route('POST')
+
+        def do_DELETE(self):
+            self._route('DELETE')
+
+    return FakeWahooHandler
+
+
+class FakeWahooServer:
+
+    """
+    Fake Wahoo API on a local port : /v1/workouts (pagination by descending starts),
+    /v1/plans, /oauth/token and FIT files, with configurable latency and injected errors.
+
+        with FakeWahooServer(num_workouts=10_000, latency_s=0.05) as server:
+            wahoo = WahooAPI(base_url=server.api_url)
+    """
+
+    def __init__(self, num_workouts:int=10_000, latency_s:float=0.0, jitter_s:float=0.0, error_rate:float=0.0,
+                 throttle_rate:float=0.0, with_fit_files:bool=False, interval:timedelta=timedelta(hours=12),
+                 latest_start:datetime|None=None, port:int=0):
+
+        latest_start = latest_start or datetime.now(UTC).replace(microsecond=0) - timedelta(days=1)
+
+        self.state = FakeWahooState(num_workouts, latest_start, interval, with_fit_files)
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(self.state, latency_s, jitter_s, error_rate, throttle_rate))
+        self.server.daemon_threads = True
+
+        self.state.base_url = self.url
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def api_url(self) -> str:
+        return self.url + '/v1/'
+
+    @property
+    def token_url(self) -> str:
+        return self.url + '/oauth/token'
+
+    def start(self) -> 'FakeWahooServer':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
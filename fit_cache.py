@@ -0,0 +1,122 @@
+import hashlib
+import os
+import tempfile
+import threading
+from http_client import http_client
+
+
+class FitFileCache:
+
+    """
+    On-disk cache of FIT files keyed by workout id and file URL.
+
+    FIT files never change once uploaded, so entries are never revalidated.
+    The least recently used files are evicted when the cache grows over max_bytes.
+    The size is measured on disk, since the parse workers write to the same directory.
+    """
+
+    def __init__(self, cache_dir:str, max_bytes:int=512*1024*1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entries(self) -> list[os.DirEntry]:
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.fit')]
+
+    def _path(self, workout_id:int, url:str) -> str:
+
+        # The URL is part of the key, so a re-uploaded file under a new URL is a new entry
+        key = hashlib.sha256(f'{workout_id}:{url}'.encode('utf-8')).hexdigest()
+
+        return os.path.join(self.cache_dir, f'{workout_id}-{key[:32]}.fit')
+
+    def get(self, workout_id:int, url:str) -> bytes|None:
+        """Return the cached content, or None on a miss."""
+
+        path = self._path(workout_id, url)
+
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return content
+
+    def put(self, workout_id:int, url:str, content:bytes):
+        """Store the content atomically and evict old entries if needed."""
+
+        path = self._path(workout_id, url)
+
+        # Write to a temporary file in the same directory then rename it, so a
+        # reader never sees a partially written file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._evict()
+
+    def _evict(self):
+
+        with self._lock:
+
+            # (mtime, size, path) of every entry, read in one scan : another process may have
+            # written or evicted files since the last put
+            entries = []
+
+            for entry in self._entries():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            size = sum(entry_size for _, entry_size, _ in entries)
+
+            for _, entry_size, path in sorted(entries):
+
+                if size <= self.max_bytes:
+                    break
+
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+                size -= entry_size
+
+    def fetch(self, workout_id:int, url:str) -> bytes:
+        """Return the FIT file content, downloading it only on a cache miss."""
+
+        content = self.get(workout_id, url)
+
+        if content is not None:
+            return content
+
+        response = http_client.get(url, endpoint='GET fit_file')
+
+        response.raise_for_status()
+
+        self.put(workout_id, url, response.content)
+
+        return response.content
+
+
+fit_cache = FitFileCache(cache_dir='fit_cache')
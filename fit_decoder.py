@@ -0,0 +1,251 @@
+import struct
+from typing import Iterator
+
+# Minimal FIT decoder that only decodes the fields of lap and session messages.
+# Definition messages are parsed so every other data message (mostly the per-second
+# records) can be skipped by its size without being decoded. decode_messages and
+# scan_data_messages share the walk over the records (_data_messages).
+
+LAP_MESG_NUM = 19
+SESSION_MESG_NUM = 18
+
+# Global message number -> field number -> (field name, scale)
+DECODED_FIELDS = {
+    LAP_MESG_NUM:{
+        7:('total_elapsed_time', 1000),
+        9:('total_distance', 100),
+        13:('avg_speed', 1000),
+        21:('total_ascent', 1),
+        22:('total_descent', 1),
+        45:('avg_grade', 100),
+    },
+    SESSION_MESG_NUM:{
+        7:('total_elapsed_time', 1000),
+        9:('total_distance', 100),
+        14:('avg_speed', 1000),
+        22:('total_ascent', 1),
+        23:('total_descent', 1),
+    },
+}
+
+MESG_NUMS = {'lap':LAP_MESG_NUM, 'session':SESSION_MESG_NUM}
+
+# Base type number -> (struct format, invalid value)
+BASE_TYPES = {
+    0x00:('B', 0xFF),               # enum
+    0x01:('b', 0x7F),               # sint8
+    0x02:('B', 0xFF),               # uint8
+    0x03:('h', 0x7FFF),             # sint16
+    0x04:('H', 0xFFFF),             # uint16
+    0x05:('i', 0x7FFFFFFF),         # sint32
+    0x06:('I', 0xFFFFFFFF),         # uint32
+    0x0A:('B', 0x00),               # uint8z
+    0x0B:('H', 0x0000),             # uint16z
+    0x0C:('I', 0x00000000),         # uint32z
+    0x0D:('B', 0xFF),               # byte
+    0x0E:('q', 0x7FFFFFFFFFFFFFFF), # sint64
+    0x0F:('Q', 0xFFFFFFFFFFFFFFFF), # uint64
+    0x10:('Q', 0x0000000000000000), # uint64z
+}
+
+
+class _Definition:
+
+    """Layout of a local message type : each field is (field number, offset in the message, size, base type)."""
+
+    __slots__ = ('global_num', 'size', 'endian', 'fields')
+
+    def __init__(self, global_num:int, size:int, endian:str, fields:tuple[tuple[int, int, int, int], ...]):
+        self.global_num = global_num
+        self.size = size
+        self.endian = endian
+        self.fields = fields
+
+
+def _parse_definition(content:bytes, offset:int, has_developer_fields:bool) -> tuple[_Definition, int]:
+    """Parse the definition message whose content starts at offset. Returns it and the offset of the next record."""
+
+    architecture = content[offset+1]
+    endian = '>' if architecture else '<'
+    global_num = struct.unpack_from(endian + 'H', content, offset+2)[0]
+    num_fields = content[offset+4]
+    offset += 5
+
+    size = 0
+    fields = []
+
+    for _ in range(num_fields):
+        field_num, field_size, base_type = content[offset], content[offset+1], content[offset+2]
+        offset += 3
+
+        fields.append((field_num, size, field_size, base_type))
+        size += field_size
+
+    if has_developer_fields:
+        num_dev_fields = content[offset]
+        offset += 1
+
+        for _ in range(num_dev_fields):
+            size += content[offset+1]
+            offset += 3
+
+    return _Definition(global_num, size, endian, tuple(fields)), offset
+
+
+def _data_messages(content:bytes, global_nums, compressed_timestamps:bool=True) -> Iterator[tuple[_Definition, int]]:
+    """
+    Walk the records of every FIT file chained in content, yielding the definition and
+    the offset of each data message of the global message numbers, without decoding it.
+    Other data messages are skipped by their size. Raises ValueError if content is not
+    a FIT file, and on compressed timestamp headers unless compressed_timestamps.
+    """
+
+    offset = 0
+
+    while offset < len(content):
+
+        header_size = content[offset]
+
+        if header_size not in (12, 14) or content[offset+8:offset+12] != b'.FIT':
+            raise ValueError('Not a FIT file')
+
+        data_size = struct.unpack_from('<I', content, offset+4)[0]
+
+        start = offset + header_size
+        end = start + data_size
+
+        if end > len(content):
+            raise ValueError('Truncated FIT file')
+
+        definitions = {} # Local message type -> definition
+        offset = start
+
+        while offset < end:
+
+            record_header = content[offset]
+            offset += 1
+
+            if record_header & 0x80:
+                # Compressed timestamp header : always a data message
+                if not compressed_timestamps:
+                    raise ValueError('Compressed timestamp headers are not supported')
+                local_type = (record_header >> 5) & 0x03
+            elif record_header & 0x40:
+                definitions[record_header & 0x0F], offset = _parse_definition(content, offset, record_header & 0x20)
+                continue
+            else:
+                local_type = record_header & 0x0F
+
+            try:
+                definition = definitions[local_type]
+            except KeyError:
+                raise ValueError(f'Data message with undefined local type {local_type}')
+
+            if definition.global_num in global_nums:
+                yield definition, offset
+
+            offset += definition.size
+
+        if offset != end:
+            raise ValueError('Malformed FIT file : data records overrun the data size')
+
+        offset = end + 2 # Skip the file CRC
+
+
+def _field_format(base_type:int, field_size:int) -> tuple[str|None, int|None]:
+    """Struct format and invalid value of a field, (None, None) if its base type or size is not handled."""
+
+    fmt, invalid = BASE_TYPES.get(base_type & 0x1F, (None, None))
+
+    if fmt is None or struct.calcsize(fmt) != field_size:
+        return None, None
+
+    return fmt, invalid
+
+
+def _decoded_layout(definition:_Definition) -> list[tuple[int, str, int, str, float]]:
+
+    decoded_fields = DECODED_FIELDS[definition.global_num]
+    layout = []
+
+    for field_num, field_offset, field_size, base_type in definition.fields:
+
+        if field_num not in decoded_fields:
+            continue
+
+        fmt, invalid = _field_format(base_type, field_size)
+
+        if fmt is None:
+            raise ValueError(f'Unsupported base type {base_type:#x} for field {field_num}')
+
+        name, scale = decoded_fields[field_num]
+        layout.append((field_offset, definition.endian + fmt, invalid, name, scale))
+
+    return layout
+
+
+def decode_messages(content:bytes, messages:tuple[str, ...]=('lap',)) -> dict[str, list[dict]]:
+    """
+    Decode the relevant fields of the lap and/or session messages of a FIT file.
+
+    Returns the decoded messages by message name. Raises ValueError if the file
+    is not a FIT file or uses something this decoder does not handle.
+    """
+
+    wanted = {MESG_NUMS[name]:name for name in messages}
+    output = {name:[] for name in messages}
+
+    # Definition -> (offset, struct format, invalid value, name, scale) of its decoded fields
+    layouts = {}
+
+    for definition, offset in _data_messages(content, wanted):
+
+        if (layout := layouts.get(definition)) is None:
+            layout = layouts[definition] = _decoded_layout(definition)
+
+        values = {name:None for name, _ in DECODED_FIELDS[definition.global_num].values()}
+
+        for field_offset, fmt, invalid, name, scale in layout:
+            raw = struct.unpack_from(fmt, content, offset+field_offset)[0]
+            if raw != invalid:
+                values[name] = raw / scale if scale != 1 else raw
+
+        output[wanted[definition.global_num]].append(values)
+
+    return output
+
+
+def scan_data_messages(content:bytes, global_num:int) -> list[tuple[dict[int, tuple[int, str, int]], int, list[int]]]:
+    """
+    Locate every data message of a global message number without decoding it.
+
+    Returns one entry per definition used by those messages : the field layout
+    (field number -> (offset in message, struct format, invalid value)), the
+    message size and the offsets of its data messages in content. Raises
+    ValueError on compressed timestamp headers, whose timestamp is not stored
+    in the message.
+    """
+
+    # Definitions repeated with the same layout share an entry
+    found = {}
+    entries = {} # Definition -> its entry in found
+
+    for definition, offset in _data_messages(content, (global_num,), compressed_timestamps=False):
+
+        if (entry := entries.get(definition)) is None:
+
+            key = (definition.size, definition.endian, definition.fields)
+
+            if key not in found:
+                layout = {}
+                for field_num, field_offset, field_size, base_type in definition.fields:
+                    fmt, invalid = _field_format(base_type, field_size)
+                    if fmt is not None:
+                        layout[field_num] = (field_offset, definition.endian + fmt, invalid)
+                found[key] = (layout, definition.size, [])
+
+            entry = entries[definition] = found[key]
+
+        entry[2].append(offset)
+
+    return list(found.values())
@@ -0,0 +1,234 @@
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, UTC
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+# Statuses worth retrying. A POST is only retried when the server says it did not
+# process the request, since retrying it after a 5xx could create a duplicate.
+# For the same reason, a POST is only retried after errors raised before it was sent.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+POST_RETRY_STATUSES = {429, 503}
+
+
+class HttpClient:
+
+    """
+    Shared HTTP client : one pooled requests.Session with keep-alive, default timeouts,
+    and retries with exponential backoff and full jitter that honor Retry-After.
+    Latency and retry counters are kept per endpoint.
+    """
+
+    def __init__(self, pool_connections:int=10, pool_maxsize:int=20, timeout:tuple[float, float]=(5, 30),
+                 max_retries:int=4, backoff_base:float=0.5, backoff_max:float=30):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._stats:dict[str, dict] = {}
+        self._latencies:dict[str, deque] = {} # Most recent latencies of each endpoint, for percentiles
+        self._session = None
+        self._pid = None
+
+    @property
+    def session(self) -> requests.Session:
+
+        # A session must not be shared with a forked process : its sockets belong to the parent
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session, self._pid = session, os.getpid()
+
+        return self._session
+
+    @staticmethod
+    def endpoint_name(method:str, url:str) -> str:
+        """Label of a request for the counters, with ids replaced : 'GET /v1/plans/:id'."""
+
+        path = re.sub(r'/\d+(?=/|$)', '/:id', urlparse(url).path)
+
+        return f'{method} {path}'
+
+    @staticmethod
+    def _may_have_been_sent(error:Exception) -> bool:
+        """Whether the request may have reached the server before the connection error."""
+
+        if isinstance(error, requests.ConnectTimeout):
+            return False
+
+        # Connection refused or DNS failure : urllib3 failed to open the connection
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+
+        return not (isinstance(error, requests.ConnectionError) and isinstance(reason, ConnectTimeoutError))
+
+    def _may_retry_error(self, method:str, error:Exception) -> bool:
+        return method != 'POST' or not self._may_have_been_sent(error)
+
+    def _retry_after(self, response:requests.Response|None) -> float|None:
+        """Delay asked by the server in seconds, from a number or an HTTP date, or None."""
+
+        if response is None or 'Retry-After' not in response.headers:
+            return None
+
+        retry_after = response.headers['Retry-After']
+
+        try:
+            return min(float(retry_after), self.backoff_max)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(retry_after) - datetime.now(UTC)).total_seconds()
+                return min(max(delay, 0), self.backoff_max)
+            except (TypeError, ValueError):
+                return None
+
+    def _retry_delay(self, attempt:int, response:requests.Response|None) -> float:
+
+        retry_after = self._retry_after(response)
+
+        if retry_after is not None:
+            return retry_after
+
+        # Full jitter : spreads the retries of concurrent callers
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _record(self, endpoint:str, elapsed:float, retries:int, failed:bool):
+
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {'requests':0, 'retries':0, 'errors':0, 'total_s':0.0, 'max_s':0.0})
+            stats['requests'] += 1
+            stats['retries'] += retries
+            stats['errors'] += failed
+            stats['total_s'] += elapsed
+            stats['max_s'] = max(stats['max_s'], elapsed)
+            self._latencies.setdefault(endpoint, deque(maxlen=10_000)).append(elapsed)
+
+    # Errors of the transport that may be retried, see _final_error
+    transport_errors = (requests.ConnectionError, requests.Timeout)
+
+    def _final_error(self, method:str, endpoint:str, start:float, attempt:int, error:Exception) -> bool:
+        """Whether a transport error ends the request, in which case it is recorded."""
+
+        if attempt >= self.max_retries or not self._may_retry_error(method, error):
+            self._record(endpoint, time.perf_counter() - start, attempt, True)
+            return True
+
+        return False
+
+    def _final_response(self, method:str, endpoint:str, start:float, attempt:int, response, limiter) -> bool:
+        """Tell the limiter about a response, and return whether it ends the request, in which case it is recorded."""
+
+        if limiter is not None:
+            if response.status_code == 429:
+                limiter.on_throttled(self._retry_after(response))
+            else:
+                limiter.on_success()
+
+        retry_statuses = POST_RETRY_STATUSES if method == 'POST' else RETRY_STATUSES
+
+        if response.status_code not in retry_statuses or attempt >= self.max_retries:
+            self._record(endpoint, time.perf_counter() - start, attempt, response.status_code >= 400)
+            return True
+
+        return False
+
+    def _backoff(self, attempt:int, response, limiter) -> float:
+
+        # After a 429 with Retry-After, the limiter already holds back the next attempt
+        if limiter is not None and response is not None and response.status_code == 429 and self._retry_after(response) is not None:
+            return 0
+
+        return self._retry_delay(attempt, response)
+
+    def request(self, method:str, url:str, endpoint:str|None=None, limiter=None, **kwargs) -> requests.Response:
+        """
+        Send a request, retrying connection errors, timeouts and retryable statuses.
+
+        The last response is returned even if its status is an error, so callers
+        keep using raise_for_status. If a limiter is given (see rate_limiter.CallLimiter),
+        every attempt waits for its tokens and the limiter is told about 429 answers.
+        """
+
+        method = method.upper()
+        endpoint = endpoint or self.endpoint_name(method, url)
+
+        kwargs.setdefault('timeout', self.timeout)
+
+        start = time.perf_counter()
+        attempt = 0
+
+        while True:
+
+            response = None
+
+            if limiter is not None:
+                limiter.acquire()
+
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except self.transport_errors as e:
+                if self._final_error(method, endpoint, start, attempt, e):
+                    raise
+            else:
+                if self._final_response(method, endpoint, start, attempt, response, limiter):
+                    return response
+
+            time.sleep(self._backoff(attempt, response, limiter))
+
+            attempt += 1
+
+    def get(self, url:str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url:str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url:str, **kwargs) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+    @staticmethod
+    def _percentile(sorted_values:list[float], q:float) -> float:
+        return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+    def stats(self) -> dict[str, dict]:
+        """
+        Counters per endpoint, with the average, median and 99th percentile latency
+        (retries and backoff included, percentiles over the last 10 000 requests).
+        """
+
+        with self._lock:
+            output = {}
+
+            for endpoint, stats in self._stats.items():
+                latencies = sorted(self._latencies[endpoint])
+                output[endpoint] = {
+                    **stats,
+                    'avg_s':stats['total_s'] / stats['requests'],
+                    'p50_s':self._percentile(latencies, 0.50),
+                    'p99_s':self._percentile(latencies, 0.99)
+                }
+
+            return output
+
+    def reset_stats(self):
+
+        with self._lock:
+            self._stats.clear()
+            self._latencies.clear()
+
+
+http_client = HttpClient()
@@ -0,0 +1,149 @@
+import argparse
+import base64
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, UTC, timedelta
+from auth import TokenManager
+from connections import DatabaseAPI, WahooAPI
+from fake_wahoo import FakeWahooServer
+from http_client import http_client
+from rate_limiter import RateLimiter
+
+# End-to-end sync load test against the local fake Wahoo API :
+#   python load_test.py --workouts 10000 --latency 0.05 --errors 0.01
+
+
+def _fake_token_manager(db_file:str, token_url:str) -> TokenManager:
+    """Token manager of the fake API, with an expired token so the first call goes through /oauth/token."""
+
+    tokens = TokenManager(db_file=db_file, client_id='load-test', client_secret='load-test', token_url=token_url)
+    tokens._store_tokens_in_db('expired', datetime.now(UTC) - timedelta(hours=1), 'refresh')
+
+    return tokens
+
+def _measure(name:str, func) -> dict:
+
+    http_client.reset_stats()
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    num_workouts = func()
+    elapsed = time.perf_counter() - start
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = http_client.stats()
+    requests = sum(s['requests'] for s in stats.values())
+
+    return {
+        'name':name,
+        'workouts':num_workouts,
+        'elapsed_s':elapsed,
+        'workouts_per_s':num_workouts / elapsed if elapsed else 0.0,
+        'requests':requests,
+        'requests_per_s':requests / elapsed if elapsed else 0.0,
+        'retries':sum(s['retries'] for s in stats.values()),
+        'errors':sum(s['errors'] for s in stats.values()),
+        'peak_memory_mb':peak / 1024 / 1024,
+        'endpoints':stats
+    }
+
+def run_load_test(num_workouts:int=10_000, new_workouts:int=120, latency_s:float=0.02, jitter_s:float=0.01,
+                  error_rate:float=0.0, throttle_rate:float=0.0, with_fit_files:bool=False, num_plans:int=5) -> list[dict]:
+    """
+    Run a cold sync, an incremental sync and plan uploads against a fake API,
+    in a temporary directory so the real database and caches are left alone.
+    """
+
+    logger = logging.getLogger('load_test')
+    logger.setLevel(logging.WARNING)
+
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, FakeWahooServer(
+        num_workouts=num_workouts, latency_s=latency_s, jitter_s=jitter_s, error_rate=error_rate,
+        throttle_rate=throttle_rate, with_fit_files=with_fit_files
+    ) as server:
+
+        os.chdir(tmp_dir)
+
+        try:
+            # The FIT cache and the record stream store use directories relative to the working directory
+            os.makedirs('fit_cache')
+            os.makedirs('record_streams')
+
+            db_file = os.path.join(tmp_dir, 'db.sqlite3')
+
+            db = DatabaseAPI(db_file=db_file, logger=logger)
+            db._create_all_tables()
+
+            # The client-side limits would dominate the timings, so they are raised far above the fake API's speed
+            wahoo = WahooAPI(base_url=server.api_url, athlete='load-test', token_manager=_fake_token_manager(db_file, server.token_url))
+            wahoo.rate_limiter = RateLimiter(app_rate=10_000, app_capacity=10_000, class_rates={'read':(10_000, 10_000), 'write':(10_000, 10_000)})
+
+            def count_workouts() -> int:
+                return db.pool.connection().execute('SELECT COUNT(*) FROM workouts').fetchone()[0]
+
+            def sync() -> int:
+                before = count_workouts()
+                db.update_workouts_table(wahoo=wahoo)
+                return count_workouts() - before
+
+            results = [_measure('cold sync', sync)]
+
+            server.state.add_workouts(new_workouts)
+            results.append(_measure('incremental sync', sync))
+
+            plan = base64.b64encode(json.dumps({'header':{'name':'Load test'}, 'intervals':[]}).encode('utf-8')).decode('utf-8')
+
+            def upload_plans() -> int:
+                for _ in range(num_plans):
+                    wahoo.upload_workout_for_today(wahoo.upload_plan(plan, db))
+                return 0
+
+            results.append(_measure('plan uploads', upload_plans))
+
+            return results
+        finally:
+            os.chdir(cwd)
+
+def print_results(results:list[dict]):
+
+    for result in results:
+
+        print(
+            f'{result["name"]} : {result["workouts"]} workouts in {result["elapsed_s"]:0.2f}s '
+            f'({result["workouts_per_s"]:0.0f} workouts/s), {result["requests"]} requests '
+            f'({result["requests_per_s"]:0.1f}/s, {result["retries"]} retries, {result["errors"]} errors), '
+            f'peak memory {result["peak_memory_mb"]:0.1f}MB'
+        )
+
+        for endpoint, stats in result['endpoints'].items():
+            print(
+                f'    {endpoint:<22} {stats["requests"]:>6} requests  '
+                f'p50 {stats["p50_s"]*1000:7.1f}ms  p99 {stats["p99_s"]*1000:7.1f}ms  max {stats["max_s"]*1000:7.1f}ms'
+            )
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Sync load test against a local fake Wahoo API')
+    parser.add_argument('--workouts', type=int, default=10_000, help='Size of the synthetic history')
+    parser.add_argument('--new-workouts', type=int, default=120, help='Workouts added before the incremental sync')
+    parser.add_argument('--latency', type=float, default=0.02, help='Server latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.01, help='Random extra latency in seconds')
+    parser.add_argument('--errors', type=float, default=0.0, help='Share of requests answered with a 5xx')
+    parser.add_argument('--throttle', type=float, default=0.0, help='Share of requests answered with a 429')
+    parser.add_argument('--fit-files', action='store_true', help='Serve FIT files, so laps and streams are synced too')
+    parser.add_argument('--plans', type=int, default=5, help='Plans uploaded after the syncs')
+    args = parser.parse_args()
+
+    print_results(run_load_test(
+        num_workouts=args.workouts, new_workouts=args.new_workouts, latency_s=args.latency, jitter_s=args.jitter,
+        error_rate=args.errors, throttle_rate=args.throttle, with_fit_files=args.fit_files, num_plans=args.plans
+    ))
@@ -1,29 +1,68 @@
 from agents import ExtractWorkoutComponentsAgent, ExtractIntervalsAgent, WorkoutGenerationAgent, SummarizerAgent
-from context import generate_user_prompt
+from context import ask_additional_info, generate_user_prompt
 from models import get_default_header_data
 from models import Plan, Header
+from pipeline import Stage, run_stages
+from plan_parser import parse_workout_markdown, PlanParseError
+import asyncio
 import time
 import logfire
 logfire.configure(scrubbing=False)
 
 time.sleep(3)
 
-def generate_plan()-> Plan:
-
-    user_prompt = generate_user_prompt()
+# Seconds each stage may take before the whole generation is abandoned
+STAGE_TIMEOUTS = {
+    'user_prompt':30,
+    'workout':180,
+    'intervals':120,
+    'description':60,
+}
 
-    generated_workout = WorkoutGenerationAgent.run_sync(user_prompt=user_prompt)
 
+async def generate_workout(user_prompt):
+    generated_workout = await WorkoutGenerationAgent.run(user_prompt=user_prompt)
     print(generated_workout.data)
+    return generated_workout.data
+
+async def extract_intervals(workout):
+
+    try:
+        return parse_workout_markdown(workout)
+    except PlanParseError as e:
+        # The extraction agents handle outputs that drift from the expected format
+        logfire.info(f'Falling back to the extraction agents : {e}')
+
+    workout_components = await ExtractWorkoutComponentsAgent.run(workout)
+
+    return (await ExtractIntervalsAgent.run(str(workout_components.data))).data
 
-    workout_components = ExtractWorkoutComponentsAgent.run_sync(generated_workout.data)
+async def summarize_workout(workout):
+    return (await SummarizerAgent.run(user_prompt=workout)).data
 
-    intervals = ExtractIntervalsAgent.run_sync(str(workout_components.data)).data
 
-    workout_description = SummarizerAgent.run_sync(user_prompt=generated_workout.data).data
+async def generate_plan_async(additional_info:str)-> Plan:
 
-    header = Header(**get_default_header_data(name="Today's workout", description=workout_description))
+    # The summary and the intervals only need the generated workout, so they run concurrently
+    stages = [
+        # Database reads and FIT parsing, kept off the event loop
+        Stage('user_prompt', lambda: asyncio.to_thread(generate_user_prompt, additional_info), timeout=STAGE_TIMEOUTS['user_prompt']),
+        Stage('workout', generate_workout, depends_on=('user_prompt',), timeout=STAGE_TIMEOUTS['workout']),
+        Stage('intervals', extract_intervals, depends_on=('workout',), timeout=STAGE_TIMEOUTS['intervals']),
+        Stage('description', summarize_workout, depends_on=('workout',), timeout=STAGE_TIMEOUTS['description']),
+    ]
 
-    return Plan(header=header, intervals=intervals)
+    timings = {}
+    results = await run_stages(stages, timings)
+
+    logfire.info('Plan generation stages : ' + ', '.join(f'{name} {seconds:0.1f}s' for name, seconds in timings.items()))
+
+    header = Header(**get_default_header_data(name="Today's workout", description=results['description']))
+
+    return Plan(header=header, intervals=results['intervals'])
+
+def generate_plan()-> Plan:
+    # Asked before the stages start, so the time taken to answer is not under any stage timeout
+    return asyncio.run(generate_plan_async(ask_additional_info()))
 
 print(generate_plan())
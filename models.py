@@ -1,11 +1,16 @@
 from datetime import datetime
-from pydantic import BaseModel, field_validator
-import requests
+from pydantic import BaseModel, ValidationError, field_validator
 from io import BytesIO
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import threading
 import fitparse
+import fit_decoder
+import struct
+from fit_cache import fit_cache
 from utils import speed_to_pace, get_default_header_data
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
 from typing import Optional, List
 from enum import Enum
 import base64
@@ -14,6 +19,10 @@ from typing import Any
 
 load_dotenv()
 
+# Wahoo workout_type_id of runs : running, track, trail and treadmill. Best efforts,
+# training load and volume only count these, not rides or other activities
+RUNNING_WORKOUT_TYPES = (1, 3, 4, 5)
+
 
 class WorkoutData(BaseModel):
 
@@ -30,36 +39,83 @@ class WorkoutData(BaseModel):
     created_at:datetime
     updated_at:datetime
 
-    @field_validator('starts', mode='before')
-    @classmethod
-    def parse_and_convert_to_UTC_starts(cls, value):
+    # JSON of workout_summary for rows read from the database, decoded on first access
+    _summary_json:str|None = PrivateAttr(default=None)
 
-        if isinstance(value, str):
-            if 'Z' in value:
-                value_with_hour_shift = value.replace("Z", "+00:00")
-                return datetime.fromisoformat(value_with_hour_shift)
-            return datetime.fromisoformat(value)
-        
-    @field_validator('created_at', mode='before')
+    @field_validator('starts', 'created_at', 'updated_at', mode='before')
     @classmethod
-    def parse_and_convert_to_UTC_created_at(cls, value):
+    def parse_and_convert_to_UTC(cls, value):
 
         if isinstance(value, str):
             if 'Z' in value:
                 value_with_hour_shift = value.replace("Z", "+00:00")
                 return datetime.fromisoformat(value_with_hour_shift)
             return datetime.fromisoformat(value)
-        
-    @field_validator('updated_at', mode='before')
+
+        return value
+
     @classmethod
-    def parse_and_convert_to_UTC_updated_at(cls, value):
+    def from_db_row(cls, row:tuple) -> 'WorkoutData':
+        """
+        Build a workout from a row of the workouts table (columns in table order) without
+        validation, since rows were validated when inserted. workout_summary stays JSON
+        until it is accessed.
+        """
+
+        id_, starts, minutes, name, plan_id, route_id, workout_token, workout_type_id, day_code, summary, created_at, updated_at = row
+
+        values = {
+            'id':id_, 'starts':datetime.fromisoformat(starts), 'minutes':minutes, 'name':name, 'plan_id':plan_id,
+            'route_id':route_id, 'workout_token':workout_token, 'workout_type_id':workout_type_id, 'day_code':day_code,
+            'created_at':datetime.fromisoformat(created_at), 'updated_at':datetime.fromisoformat(updated_at)
+        }
+
+        if not summary:
+            values['workout_summary'] = None
+
+        # Same state as model_construct sets, which is several times slower
+        workout = cls.__new__(cls)
+        object.__setattr__(workout, '__dict__', values)
+        object.__setattr__(workout, '__pydantic_fields_set__', set(cls.__pydantic_fields__))
+        object.__setattr__(workout, '__pydantic_extra__', None)
+        object.__setattr__(workout, '__pydantic_private__', {'_summary_json':summary or None})
+
+        return workout
+
+    def __getattr__(self, name:str):
+
+        # Only reached while the summary of a database row is not decoded : it is then read from __dict__.
+        # The JSON is read from the private slot directly, pydantic's private attribute access costs microseconds
+        if name == 'workout_summary' and (private := self.__pydantic_private__) and private['_summary_json'] is not None:
+            values = self.__dict__
+            summary = values['workout_summary'] = json.loads(private['_summary_json'])
+            private['_summary_json'] = None
+            # The fields after the summary move behind it : dumps and repr follow the order of __dict__
+            values['created_at'] = values.pop('created_at')
+            values['updated_at'] = values.pop('updated_at')
+            return summary
+
+        return super().__getattr__(name)
+
+    # A lazy summary is decoded first, so workouts read from the database dump, compare and print as validated ones
+
+    def model_dump(self, *args, **kwargs):
+        self.workout_summary
+        return super().model_dump(*args, **kwargs)
+
+    def model_dump_json(self, *args, **kwargs):
+        self.workout_summary
+        return super().model_dump_json(*args, **kwargs)
+
+    def __eq__(self, other):
+        if isinstance(other, WorkoutData):
+            self.workout_summary, other.workout_summary
+        return super().__eq__(other)
+
+    def __repr_args__(self):
+        self.workout_summary
+        return super().__repr_args__()
 
-        if isinstance(value, str):
-            if 'Z' in value:
-                value_with_hour_shift = value.replace("Z", "+00:00")
-                return datetime.fromisoformat(value_with_hour_shift)
-            return datetime.fromisoformat(value)
-        
     @property
     def _fit_file_url(self) -> str:
         return self.workout_summary['file']['url']
@@ -67,45 +123,157 @@ class WorkoutData(BaseModel):
     @property
     def laps(self) -> list[dict]:
 
-        response = requests.get(self._fit_file_url)
+        # Read the FIT file from the local cache, only downloading it the first time
+        content = fit_cache.fetch(self.id, self._fit_file_url)
 
-        response.raise_for_status()
+        return extract_laps(content)
 
-        fitfile = fitparse.FitFile(BytesIO(response.content))
 
-        output = []
+# FIT lap fields kept for reports : field key -> (display name, units)
+LAP_FIELDS = {
+    'avg_speed':('Average speed', 'm/s'), 
+    'total_distance':('Total distance', 'm'), 
+    'total_elapsed_time':('Total elapsed time', 's'),
+    'total_descent':('Total descent', 'm'), 
+    'total_ascent':('Total ascent', 'm'), 
+    'avg_grade':('Average grade', '%')
+}
 
-        relevant_fields = {
-            'avg_speed':'Average speed', 
-            'total_distance':'Total distance', 
-            'total_elapsed_time':'Total elapsed time',
-            'total_descent':'Total descent', 
-            'total_ascent':'Total ascent', 
-            'avg_grade':'Average grade'
-        }
+def read_lap_values(fit_content:bytes) -> list[dict]:
+    """Decode the raw values of the relevant fields of every lap in a FIT file."""
 
-        for lap in fitfile.get_messages('lap'):
-            
-            lap_data = {}
-
-            for field_key, field_name in relevant_fields.items():
-
-                if field_key == 'avg_speed':
-                    value = lap.get_value(field_key)
-                    lap_data[field_name] = speed_to_pace(value)
-                    
-                elif field_key == 'total_elapsed_time':
-                    value = lap.get_value(field_key)
-                    minutes = int(value//60) # Convert from secs to min and secs
-                    secs = int(value % 60)
-                    lap_data[field_name] =  f'{minutes}:{secs}min'
+    # Fast path : only decode lap messages, skipping the records
+    try:
+        laps = fit_decoder.decode_messages(fit_content, messages=('lap',))['lap']
+    except (ValueError, IndexError, struct.error):
+        pass
+    else:
+        return [{field_key:lap[field_key] for field_key in LAP_FIELDS} for lap in laps]
+
+    fitfile = fitparse.FitFile(BytesIO(fit_content))
+
+    return [{field_key:lap.get_value(field_key) for field_key in LAP_FIELDS} for lap in fitfile.get_messages('lap')]
+
+def _fetch_fit_file(workout:WorkoutData) -> bytes:
+    return fit_cache.fetch(workout.id, workout._fit_file_url)
+
+
+# Batches smaller than this are decoded in the calling process : a file takes about 1ms
+# with the lap decoder, less than handing it to a worker
+PARSE_IN_PROCESS_BELOW = 8
+
+_parse_pool:ProcessPoolExecutor|None = None
+_parse_pool_lock = threading.Lock()
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Process pool shared by the FIT decoding calls, created on first use with all its workers.
+
+    Workers are forked from the calling process, so callers that start threads
+    (downloads, page prefetching) get the pool before starting them.
+    """
+
+    global _parse_pool
+
+    with _parse_pool_lock:
+
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor()
+            # The first task forks every worker now, not in the middle of a later call
+            _parse_pool.submit(int).result()
+
+        return _parse_pool
+
+def submit_parse(func, *args) -> Future:
+    """Submit func(*args) to the shared process pool, replacing the pool if it is broken."""
+
+    global _parse_pool
+
+    pool = get_parse_pool()
+
+    try:
+        return pool.submit(func, *args)
+    except BrokenProcessPool:
+        # A worker killed by the OS breaks the whole pool : the tasks already submitted fail,
+        # the next ones go to a new pool
+        with _parse_pool_lock:
+            if _parse_pool is pool:
+                _parse_pool = None
+        pool.shutdown(wait=False)
+
+    return get_parse_pool().submit(func, *args)
+
+def fetch_lap_values(workouts:list[WorkoutData], download_workers:int=8) -> list[list[dict]|Exception]:
+    """
+    Download the FIT files of several workouts concurrently in a thread pool and
+    decode their laps in the shared process pool, since fitparse is CPU-bound and holds the GIL.
+    Small batches are decoded in the calling process.
+
+    Returns, in the order of workouts, the lap values of each workout or the
+    exception raised while fetching or decoding its file.
+    """
+
+    if not workouts:
+        return []
+
+    results:list[list[dict]|Exception] = [None] * len(workouts)
+
+    in_process = len(workouts) < PARSE_IN_PROCESS_BELOW
+
+    if not in_process:
+        # Started before the download threads
+        get_parse_pool()
+
+    with ThreadPoolExecutor(max_workers=min(download_workers, len(workouts))) as downloads:
+
+        download_futures = [downloads.submit(_fetch_fit_file, w) for w in workouts]
+
+        # Each file is handed to the parsers as soon as it is downloaded,
+        # while the remaining downloads keep running
+        parse_futures = {}
+
+        for i, future in enumerate(download_futures):
+            try:
+                if in_process:
+                    results[i] = read_lap_values(future.result())
                 else:
-                    value = str(lap.get(field_key))
-                    lap_data[field_name] =  value.replace(']','').replace('[', '')
+                    parse_futures[i] = submit_parse(read_lap_values, future.result())
+            except Exception as e:
+                results[i] = e
+
+        for i, future in parse_futures.items():
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = e
+
+    return results
+
+def format_lap(lap_values:dict) -> dict:
 
-            output.append(lap_data)
+    lap_data = {}
+
+    for field_key, (field_name, units) in LAP_FIELDS.items():
+
+        value = lap_values.get(field_key)
+
+        if field_key == 'avg_speed':
+            lap_data[field_name] = speed_to_pace(value)
+            
+        elif field_key == 'total_elapsed_time':
+            minutes = int(value//60) # Convert from secs to min and secs
+            secs = int(value % 60)
+            lap_data[field_name] =  f'{minutes}:{secs}min'
+        elif value is None:
+            lap_data[field_name] = 'None'
+        else:
+            lap_data[field_name] = f'{field_key}: {value} {units}'
 
-        return output
+    return lap_data
+
+def extract_laps(fit_content:bytes) -> list[dict]:
+
+    return [format_lap(lap_values) for lap_values in read_lap_values(fit_content)]
 
 class WorkoutEndpointResponseJSONModel(BaseModel):
     workouts : list[WorkoutData]
@@ -114,6 +282,27 @@ class WorkoutEndpointResponseJSONModel(BaseModel):
     per_page: int
     order : str
     sort : str
+    rejected : dict[int|str, str] = {} # Workouts of the page that failed validation : id -> error
+
+    @classmethod
+    def from_page(cls, data:dict) -> 'WorkoutEndpointResponseJSONModel':
+        """Validate a page one workout at a time, so an invalid workout is rejected alone instead of failing the page."""
+
+        workouts = []
+        rejected = {}
+
+        for index, workout in enumerate(data.get('workouts') or []):
+            try:
+                workouts.append(WorkoutData(**workout))
+            except (ValidationError, TypeError) as e:
+                key = workout.get('id') if isinstance(workout, dict) else None
+                rejected[key if isinstance(key, int) else f'#{index} of page {data.get("page")}'] = str(e)
+
+        return cls(**{**data, 'workouts':workouts, 'rejected':rejected})
+
+    @property
+    def num_received(self) -> int:
+        return len(self.workouts) + len(self.rejected)
 
     # Assert that the API still returns workouts in the expected order
 
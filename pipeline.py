@@ -0,0 +1,87 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+# Small DAG of async stages : each stage starts as soon as the stages it depends on
+# are done, so the total latency is the critical path rather than the sum of the stages.
+
+
+class Stage:
+
+    """
+    Step of a pipeline. func is called with the results of the dependencies as keyword
+    arguments, and must finish within timeout seconds (None for no limit).
+    """
+
+    def __init__(self, name:str, func:Callable[..., Awaitable], depends_on:tuple[str, ...]=(), timeout:float|None=None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+
+
+def _check_graph(stages:list[Stage]):
+
+    names = {stage.name for stage in stages}
+
+    if len(names) != len(stages):
+        raise ValueError('Stage names must be unique')
+
+    for stage in stages:
+        if missing := set(stage.depends_on) - names:
+            raise ValueError(f'Stage {stage.name} depends on unknown stages : {sorted(missing)}')
+
+    # Kahn's algorithm : a cycle leaves stages that never become ready
+    remaining = {stage.name:set(stage.depends_on) for stage in stages}
+
+    while ready := [name for name, deps in remaining.items() if not deps]:
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+    if remaining:
+        raise ValueError(f'Stages have circular dependencies : {sorted(remaining)}')
+
+async def run_stages(stages:list[Stage], timings:dict[str, float]|None=None) -> dict:
+    """
+    Run the stages concurrently, following their dependencies, and return their results by name.
+
+    If a stage fails or times out, the stages still running are cancelled and its exception
+    is raised (a TimeoutError for timeouts). The duration of every finished stage is written
+    to timings if given.
+    """
+
+    _check_graph(stages)
+
+    tasks:dict[str, asyncio.Task] = {}
+
+    async def run(stage:Stage):
+
+        inputs = {name:await tasks[name] for name in stage.depends_on}
+
+        start = time.perf_counter()
+
+        try:
+            result = await asyncio.wait_for(stage.func(**inputs), stage.timeout)
+        except TimeoutError:
+            raise TimeoutError(f'Stage {stage.name} timed out after {stage.timeout}s')
+
+        if timings is not None:
+            timings[stage.name] = time.perf_counter() - start
+
+        return result
+
+    for stage in stages:
+        tasks[stage.name] = asyncio.create_task(run(stage), name=stage.name)
+
+    try:
+        # gather raises the first failure, which is the failing stage and not one of its dependents
+        results = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+
+    return dict(zip(tasks, results))
@@ -0,0 +1,226 @@
+import re
+from pydantic import ValidationError
+from models import Interval, IntensityType, Target, TargetType, TriggerType
+from utils import minutes_to_secs, pace_to_speed_mps
+
+# Parser of the markdown format that WorkoutGenerationAgent's system prompt asks for :
+#
+#   ## 1 Warm-Up
+#   - Description : ...
+#   - Parameters : Time: 10 minutes, Pace: 6:00-6:30 min/km
+#   ### 2 Intervals
+#   - Repetitions: 5
+#   - Subsets :
+#       ## 2.1 Hard
+#       - Parameters : Distance: 400 m, Pace: 4:10-4:20 min/km
+#
+# Unnumbered headings before the first interval are titles and skipped, the first one after it ends
+# the workout (e.g. a '### Summary'). Anything else outside this format raises PlanParseError, so the
+# caller can fall back to the extraction agents.
+
+
+class PlanParseError(ValueError):
+    """Raised when the coach output does not follow the expected markdown format."""
+
+
+HEADING = re.compile(r'^#{1,4}\s*(\d+(?:\.\d+)?)\.?\s+(.+?)\s*:?$')
+ITEM = re.compile(r'^[-*]\s*(\w+)\s*:\s*(.*)$')
+
+CLOCK = re.compile(r'^(\d+):(\d{2})$')
+MINUTES = re.compile(r'(\d+(?:\.\d+)?)\s*(?:minutes?|mins?)\b', re.IGNORECASE)
+SECONDS = re.compile(r'(\d+)\s*(?:seconds?|secs?|s)\b', re.IGNORECASE)
+DISTANCE = re.compile(r'^(\d+(?:\.\d+)?)\s*(km|kilometers?|kilometres?|m|meters?|metres?)$', re.IGNORECASE)
+PACE_RANGE = re.compile(r'^(\d+):(\d{2})\s*(?:-|–|to)\s*(\d+):(\d{2})\s*(?:min)?\s*(?:/|per)\s*km$', re.IGNORECASE)
+
+# Keywords of interval names -> intensity type, checked in order
+INTENSITY_KEYWORDS = [
+    ('warm', IntensityType.wu),
+    ('cool', IntensityType.cd),
+    ('recover', IntensityType.recover),
+    ('rest', IntensityType.rest),
+    ('tempo', IntensityType.tempo),
+    ('threshold', IntensityType.lt),
+]
+
+
+def _parse_duration(value:str) -> int:
+    """'10 minutes', '90 seconds', '1 min 30 sec' or '1:30' -> seconds."""
+
+    value = value.strip()
+
+    if match := CLOCK.match(value):
+        return minutes_to_secs(int(match.group(1)), int(match.group(2)))
+
+    minutes = MINUTES.findall(value)
+    seconds = SECONDS.findall(value)
+
+    if len(minutes) > 1 or len(seconds) > 1 or not (minutes or seconds) or re.search(r'\d\s*(?:-|–|to)\s*\d', value):
+        raise PlanParseError(f'Unsupported time : {value!r}')
+
+    return round(minutes_to_secs(float(minutes[0]) if minutes else 0, int(seconds[0]) if seconds else 0))
+
+def _parse_distance(value:str) -> float:
+    """'400 m' or '1.5 km' -> meters."""
+
+    match = DISTANCE.match(value.strip())
+
+    if not match:
+        raise PlanParseError(f'Unsupported distance : {value!r}')
+
+    distance, unit = float(match.group(1)), match.group(2).lower()
+
+    return distance * 1000 if unit.startswith('k') else distance
+
+def _parse_pace_target(value:str) -> Target:
+    """'4:10-4:20 min/km' -> speed target, the slower pace being the low speed."""
+
+    match = PACE_RANGE.match(value.strip())
+
+    if not match:
+        raise PlanParseError(f'Unsupported pace : {value!r}, expected a range such as 4:10-4:20 min/km')
+
+    fast_min, fast_sec, slow_min, slow_sec = map(int, match.groups())
+
+    speeds = [pace_to_speed_mps(fast_min, fast_sec), pace_to_speed_mps(slow_min, slow_sec)]
+
+    try:
+        return Target(type=TargetType.speed, low=min(speeds), high=max(speeds))
+    except ValidationError as e:
+        raise PlanParseError(f'Invalid pace range {value!r} : {e}')
+
+def _parse_parameters(parameters:str) -> tuple[TriggerType, float, Target]:
+    """'Time: 10 minutes, Pace: 6:00-6:30 min/km' -> exit trigger and target."""
+
+    values = {}
+
+    for part in parameters.split(','):
+        if not part.strip():
+            continue
+        key, sep, value = part.partition(':')
+        if not sep:
+            raise PlanParseError(f'Unsupported parameter : {part.strip()!r}')
+        values[key.strip().lower()] = value
+
+    if 'pace' not in values:
+        raise PlanParseError(f'No pace in parameters : {parameters!r}')
+
+    if ('time' in values) == ('distance' in values):
+        raise PlanParseError(f'Parameters need either a time or a distance : {parameters!r}')
+
+    if 'time' in values:
+        trigger = (TriggerType.time, _parse_duration(values['time']))
+    else:
+        trigger = (TriggerType.distance, _parse_distance(values['distance']))
+
+    return *trigger, _parse_pace_target(values['pace'])
+
+def _intensity(name:str) -> IntensityType:
+
+    lowered = name.lower()
+
+    for keyword, intensity in INTENSITY_KEYWORDS:
+        if keyword in lowered:
+            return intensity
+
+    return IntensityType.active
+
+def _split_blocks(markdown:str) -> list[dict]:
+    """Numbered headings in order, each with the items listed under it, up to the first unnumbered heading after them."""
+
+    blocks = []
+
+    for raw_line in markdown.splitlines():
+
+        # Markdown emphasis is often added around names and keys
+        line = raw_line.strip().replace('**', '').replace('__', '')
+
+        if match := HEADING.match(line):
+            blocks.append({'num':match.group(1), 'name':match.group(2).strip(), 'items':{}})
+
+        elif line.startswith('#'):
+            # Items under it would otherwise land in the previous interval
+            if blocks:
+                break
+
+        elif (match := ITEM.match(line)) and blocks:
+            key = match.group(1).lower()
+            if key in blocks[-1]['items']:
+                raise PlanParseError(f'Duplicate {key!r} for interval {blocks[-1]["num"]} {blocks[-1]["name"]!r}')
+            blocks[-1]['items'][key] = match.group(2).strip()
+
+    return blocks
+
+def _leaf(block:dict) -> Interval:
+
+    if 'parameters' not in block['items']:
+        raise PlanParseError(f'No parameters for interval {block["num"]} {block["name"]!r}')
+
+    trigger_type, trigger_value, target = _parse_parameters(block['items']['parameters'])
+
+    return Interval(
+        name=block['name'], exit_trigger_type=trigger_type, exit_trigger_value=trigger_value,
+        intensity_type=_intensity(block['name']), targets=[target]
+    )
+
+def parse_workout_markdown(markdown:str) -> list[Interval]:
+    """
+    Build the intervals of a workout written in WorkoutGenerationAgent's markdown format,
+    with the same conversions as the extraction agents' tools. Raises PlanParseError if
+    the text does not follow the format.
+    """
+
+    blocks = _split_blocks(markdown)
+
+    if not blocks:
+        raise PlanParseError('No numbered interval headings found')
+
+    # Subsets would be attached to whichever block has their parent number
+    top_level = [block['num'] for block in blocks if '.' not in block['num']]
+
+    if duplicates := sorted({num for num in top_level if top_level.count(num) > 1}):
+        raise PlanParseError(f'Duplicate interval numbers : {duplicates}')
+
+    intervals = []
+    parents = {} # Number of each repeated block -> its subsets
+
+    for block in blocks:
+
+        num = block['num']
+
+        if '.' in num:
+            parent = num.split('.')[0]
+            if parent not in parents:
+                raise PlanParseError(f'Subset {num} is not under a block with repetitions')
+            parents[parent].append(_leaf(block))
+
+        elif 'repetitions' in block['items']:
+            match = re.match(r'^(\d+)', block['items']['repetitions'])
+            if not match or int(match.group(1)) < 1:
+                raise PlanParseError(f'Unsupported repetitions for {num} {block["name"]!r} : {block["items"]["repetitions"]!r}')
+
+            parents[num] = []
+            # Wahoo counts the repeats after the first iteration
+            intervals.append((block, int(match.group(1)) - 1))
+
+        else:
+            intervals.append(_leaf(block))
+
+    output = []
+
+    for interval in intervals:
+
+        if isinstance(interval, Interval):
+            output.append(interval)
+            continue
+
+        block, repeats = interval
+
+        if not parents[block['num']]:
+            raise PlanParseError(f'Block {block["num"]} {block["name"]!r} has repetitions but no subsets')
+
+        output.append(Interval(
+            name=block['name'], exit_trigger_type=TriggerType.repeat, exit_trigger_value=repeats,
+            intervals=parents[block['num']]
+        ))
+
+    return output
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call would have to wait longer than its timeout for a token."""
+
+
+class TokenBucket:
+
+    """
+    Thread-safe token bucket usable from threads and from asyncio.
+
+    A call reserves its token immediately (the balance can go negative) and then
+    sleeps outside the lock until the token is due, so waiting callers are served
+    in order. The rate is halved when the API answers 429 and recovers additively
+    on successful calls.
+    """
+
+    def __init__(self, rate:float, capacity:float, min_rate:float|None=None):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate or rate / 16
+
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.metrics = {'acquired':0, 'waited':0, 'wait_s':0.0, 'max_wait_s':0.0, 'rejected':0, 'throttled':0}
+
+    def _refill(self, now:float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _reserve(self, tokens:float, timeout:float|None) -> float:
+        """Take the tokens and return how long to wait for them, or raise if that exceeds timeout."""
+
+        with self._lock:
+            self._refill(time.monotonic())
+
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+
+            if timeout is not None and wait > timeout:
+                self.metrics['rejected'] += 1
+                raise RateLimitExceeded(f'A token would take {wait:0.2f}s, more than the {timeout:0.2f}s timeout')
+
+            self._tokens -= tokens
+
+            self.metrics['acquired'] += 1
+            if wait:
+                self.metrics['waited'] += 1
+                self.metrics['wait_s'] += wait
+                self.metrics['max_wait_s'] = max(self.metrics['max_wait_s'], wait)
+
+            return wait
+
+    def acquire(self, tokens:float=1, timeout:float|None=None) -> float:
+        """Block until the tokens are available. Returns the time waited."""
+
+        wait = self._reserve(tokens, timeout)
+
+        if wait:
+            time.sleep(wait)
+
+        return wait
+
+    async def acquire_async(self, tokens:float=1, timeout:float|None=None) -> float:
+        """Same as acquire, without blocking the event loop."""
+
+        wait = self._reserve(tokens, timeout)
+
+        if wait:
+            await asyncio.sleep(wait)
+
+        return wait
+
+    def on_throttled(self, retry_after:float|None=None):
+        """The API answered 429 : slow down, and hand out no token before retry_after."""
+
+        with self._lock:
+            self._refill(time.monotonic())
+
+            self.metrics['throttled'] += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+
+            if retry_after:
+                self._tokens = min(self._tokens, 0) - retry_after * self.rate
+
+    def on_success(self):
+
+        with self._lock:
+            if self.rate < self.base_rate:
+                self.rate = min(self.base_rate, self.rate + self.base_rate / 20)
+
+
+class CallLimiter:
+
+    """Tokens a single call needs : one from the app-wide bucket and one from its athlete/endpoint bucket."""
+
+    def __init__(self, buckets:list[TokenBucket], timeout:float|None=None):
+        self.buckets = buckets
+        self.timeout = timeout
+
+    def acquire(self) -> float:
+        return sum(bucket.acquire(timeout=self.timeout) for bucket in self.buckets)
+
+    async def acquire_async(self) -> float:
+        waited = 0.0
+        for bucket in self.buckets:
+            waited += await bucket.acquire_async(timeout=self.timeout)
+        return waited
+
+    def on_throttled(self, retry_after:float|None=None):
+        for bucket in self.buckets:
+            bucket.on_throttled(retry_after)
+
+    def on_success(self):
+        for bucket in self.buckets:
+            bucket.on_success()
+
+
+class RateLimiter:
+
+    """
+    Client-side limits for the Wahoo API : one bucket for the whole app, and one per
+    athlete and endpoint class ('read' or 'write'). Rates are in calls per second.
+    """
+
+    def __init__(self, app_rate:float=10, app_capacity:float=20,
+                 class_rates:dict[str, tuple[float, float]]|None=None, timeout:float|None=None):
+        self.app_bucket = TokenBucket(app_rate, app_capacity)
+        # Endpoint class -> (rate, capacity) of each athlete's bucket
+        self.class_rates = class_rates or {'read':(5, 10), 'write':(1, 5)}
+        self.timeout = timeout
+
+        self._buckets:dict[tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, athlete:str, endpoint_class:str) -> TokenBucket:
+
+        key = (athlete, endpoint_class)
+
+        with self._lock:
+            if key not in self._buckets:
+                rate, capacity = self.class_rates[endpoint_class]
+                self._buckets[key] = TokenBucket(rate, capacity)
+
+            return self._buckets[key]
+
+    def for_call(self, athlete:str, endpoint_class:str) -> CallLimiter:
+        return CallLimiter([self.app_bucket, self.bucket(athlete, endpoint_class)], timeout=self.timeout)
+
+    def metrics(self) -> dict[str, dict]:
+
+        with self._lock:
+            buckets = {f'{athlete}/{endpoint_class}':bucket for (athlete, endpoint_class), bucket in self._buckets.items()}
+
+        buckets['app'] = self.app_bucket
+
+        return {name:{**bucket.metrics, 'rate':bucket.rate} for name, bucket in buckets.items()}
+
+
+rate_limiter = RateLimiter()
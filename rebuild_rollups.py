@@ -0,0 +1,16 @@
+import argparse
+from connections import DatabaseAPI, logger
+
+# Recompute the weekly and monthly rollups from scratch, e.g. after editing the database by hand :
+#   python rebuild_rollups.py --db db.sqlite3
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Rebuild the weekly and monthly rollup tables')
+    parser.add_argument('--db', default='db.sqlite3', help='SQLite database file')
+    args = parser.parse_args()
+
+    db = DatabaseAPI(db_file=args.db, logger=logger)
+    db._create_all_tables()
+    db.rebuild_rollups()
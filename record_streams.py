@@ -0,0 +1,211 @@
+import json
+from datetime import timezone
+import os
+import shutil
+import tempfile
+import numpy as np
+import fitparse
+from io import BytesIO
+import fit_decoder
+from fit_cache import fit_cache
+
+RECORD_MESG_NUM = 20
+FIT_EPOCH_OFFSET = 631065600 # Seconds between the Unix epoch and the FIT epoch (1989-12-31)
+
+# Stream name -> (record field number, scale, offset, stored dtype)
+STREAM_FIELDS = {
+    'distance':(5, 100, 0, np.float32),     # m
+    'speed':(6, 1000, 0, np.float32),       # m/s
+    'heart_rate':(3, 1, 0, np.float32),     # bpm
+    'altitude':(2, 5, 500, np.float32),     # m
+}
+
+# Stream name -> (field number, scale, offset) of the 32 bit enhanced_* field, used
+# where the base field is missing or invalid, as fitparse's get_value fallback does
+ENHANCED_FIELDS = {
+    'speed':(73, 1000, 0),
+    'altitude':(78, 5, 500),
+}
+
+
+def decode_record_streams(content:bytes) -> dict[str, np.ndarray]:
+    """
+    Decode the per-second record messages of a FIT file into one array per stream.
+
+    'timestamp' holds Unix seconds, invalid or missing values are NaN. The record
+    messages are located with the FIT decoder and gathered with NumPy, and fitparse
+    is used when the decoder rejects the file.
+    """
+
+    try:
+        return _decode_record_streams_fast(content)
+    except ValueError:
+        return _decode_record_streams_fitparse(content)
+
+def _gather_field(buffer:np.ndarray, offsets:np.ndarray, layout:dict, field_num:int, scale:float, offset:float) -> np.ndarray|None:
+    """Scaled values of a field in every message of a layout, NaN where invalid, or None if the layout lacks it."""
+
+    if field_num not in layout:
+        return None
+
+    field_offset, fmt, invalid = layout[field_num]
+    dtype = np.dtype(fmt)
+
+    # Gather the bytes of the field in every message, then reinterpret them
+    index = offsets[:, None] + field_offset + np.arange(dtype.itemsize)
+    raw = np.ascontiguousarray(buffer[index]).view(dtype).ravel()
+
+    values = raw.astype(np.float64) / scale - offset
+    values[raw == invalid] = np.nan
+
+    return values
+
+def _decode_record_streams_fast(content:bytes) -> dict[str, np.ndarray]:
+
+    buffer = np.frombuffer(content, dtype=np.uint8)
+
+    columns = {name:[] for name in ['timestamp', *STREAM_FIELDS]}
+    all_offsets = []
+
+    for layout, _, offsets in fit_decoder.scan_data_messages(content, RECORD_MESG_NUM):
+
+        offsets = np.asarray(offsets, dtype=np.int64)
+        all_offsets.append(offsets)
+
+        if 253 not in layout:
+            raise ValueError('Record messages without timestamp')
+
+        field_offset, fmt, _ = layout[253]
+        index = offsets[:, None] + field_offset + np.arange(np.dtype(fmt).itemsize)
+        columns['timestamp'].append(np.ascontiguousarray(buffer[index]).view(fmt).ravel().astype(np.int64) + FIT_EPOCH_OFFSET)
+
+        for name, (field_num, scale, offset, _) in STREAM_FIELDS.items():
+
+            values = _gather_field(buffer, offsets, layout, field_num, scale, offset)
+
+            if name in ENHANCED_FIELDS:
+                enhanced = _gather_field(buffer, offsets, layout, *ENHANCED_FIELDS[name])
+                if values is None:
+                    values = enhanced
+                elif enhanced is not None:
+                    values = np.where(np.isnan(values), enhanced, values)
+
+            columns[name].append(np.full(len(offsets), np.nan) if values is None else values)
+
+    if not all_offsets:
+        return {name:np.empty(0, dtype=np.int64 if name == 'timestamp' else np.float64) for name in columns}
+
+    # Messages of different definitions are interleaved in the file
+    order = np.argsort(np.concatenate(all_offsets), kind='stable')
+
+    return {name:np.concatenate(values)[order] for name, values in columns.items()}
+
+def _decode_record_streams_fitparse(content:bytes) -> dict[str, np.ndarray]:
+
+    fitfile = fitparse.FitFile(BytesIO(content))
+
+    timestamps = []
+    columns = {name:[] for name in STREAM_FIELDS}
+
+    for record in fitfile.get_messages('record'):
+
+        timestamp = record.get_value('timestamp')
+
+        if timestamp is None:
+            continue
+
+        # fitparse returns naive datetimes in UTC
+        timestamps.append(int(timestamp.replace(tzinfo=timezone.utc).timestamp()))
+
+        for name in STREAM_FIELDS:
+            value = record.get_value(name)
+            if value is None:
+                value = record.get_value(f'enhanced_{name}')
+            columns[name].append(np.nan if value is None else value)
+
+    output = {'timestamp':np.asarray(timestamps, dtype=np.int64)}
+    output.update({name:np.asarray(values, dtype=np.float64) for name, values in columns.items()})
+
+    return output
+
+
+class RecordStreamStore:
+
+    """
+    Columnar on-disk storage of record streams, one directory of .npy files per workout.
+
+    Timestamps are stored as uint32 offsets from the first record (the start is kept
+    in meta.json), which halves their size and keeps them randomly accessible.
+    Arrays are loaded as read-only memory maps.
+    """
+
+    def __init__(self, root_dir:str):
+        self.root_dir = root_dir
+
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _dir(self, workout_id:int) -> str:
+        return os.path.join(self.root_dir, str(workout_id))
+
+    def has(self, workout_id:int) -> bool:
+        return os.path.exists(os.path.join(self._dir(workout_id), 'meta.json'))
+
+    def workout_ids(self) -> list[int]:
+        return sorted(int(name) for name in os.listdir(self.root_dir) if name.isdigit() and self.has(int(name)))
+
+    def save(self, workout_id:int, streams:dict[str, np.ndarray]):
+        """Store the streams of a workout, replacing them atomically if they exist."""
+
+        timestamps = streams['timestamp']
+        start_timestamp = int(timestamps[0]) if len(timestamps) else 0
+
+        tmp_dir = tempfile.mkdtemp(dir=self.root_dir, prefix='.tmp-')
+
+        try:
+            np.save(os.path.join(tmp_dir, 'elapsed.npy'), (timestamps - start_timestamp).astype(np.uint32))
+
+            for name, (*_, dtype) in STREAM_FIELDS.items():
+                np.save(os.path.join(tmp_dir, f'{name}.npy'), streams[name].astype(dtype))
+
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+                json.dump({'start_timestamp':start_timestamp, 'num_records':len(timestamps)}, f)
+
+            target = self._dir(workout_id)
+
+            if os.path.exists(target):
+                shutil.rmtree(target)
+
+            os.replace(tmp_dir, target)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def load(self, workout_id:int) -> dict[str, np.ndarray]:
+        """Return the memory-mapped streams of a workout, with 'elapsed' in seconds since start_timestamp."""
+
+        directory = self._dir(workout_id)
+
+        streams = {name:np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in ['elapsed', *STREAM_FIELDS]}
+
+        return streams
+
+    def start_timestamp(self, workout_id:int) -> int:
+
+        with open(os.path.join(self._dir(workout_id), 'meta.json'), 'r') as f:
+            return json.load(f)['start_timestamp']
+
+    def timestamps(self, workout_id:int) -> np.ndarray:
+        """Return the absolute Unix timestamps of the records of a workout."""
+
+        return self.start_timestamp(workout_id) + self.load(workout_id)['elapsed'].astype(np.int64)
+
+
+def convert_workout_records(workout_id:int, fit_file_url:str, root_dir:str):
+    """Decode the records of a workout's FIT file (read through the FIT cache) and store them."""
+
+    content = fit_cache.fetch(workout_id, fit_file_url)
+
+    RecordStreamStore(root_dir).save(workout_id, decode_record_streams(content))
+
+
+record_store = RecordStreamStore(root_dir='record_streams')
@@ -0,0 +1,133 @@
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class _ThreadConnection:
+
+    """Owner of a thread's connection, kept in the thread's local storage : it closes the connection when the thread ends"""
+
+    def __init__(self, conn:sqlite3.Connection):
+        self.conn = conn
+
+    def __del__(self):
+        self.conn.close()
+
+
+class ConnectionManager:
+
+    """Hands out one long-lived SQLite connection per thread for a database file"""
+
+    def __init__(self, db_file:str, cache_size_kib:int=20_000, mmap_size:int=256*1024*1024, busy_timeout_ms:int=5_000):
+        self.db_file = db_file
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Weak references, so pool and to_thread workers don't keep their connection open after they end
+        self._connections:weakref.WeakSet[_ThreadConnection] = weakref.WeakSet()
+
+    def _open(self) -> _ThreadConnection:
+
+        # Autocommit mode : transactions are opened explicitly by transaction()
+        conn = sqlite3.connect(self.db_file, isolation_level=None, check_same_thread=False)
+
+        # WAL lets readers run while a writer is active. With WAL, synchronous=NORMAL
+        # only fsyncs at checkpoints instead of on every commit
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kib)}') # Negative value is in KiB
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+
+        owner = _ThreadConnection(conn)
+
+        with self._lock:
+            self._connections.add(owner)
+
+        return owner
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the connection of the calling thread, opening it on first use."""
+
+        owner = getattr(self._local, 'owner', None)
+
+        if owner is None:
+            owner = self._open()
+            self._local.owner = owner
+            self._local.depth = 0
+            self._local.write = False
+
+        return owner.conn
+
+    @contextmanager
+    def transaction(self, write:bool=True) -> Iterator[sqlite3.Cursor]:
+        """
+        Run the block inside a transaction on the thread's connection.
+
+        Write transactions take the write lock when they start (BEGIN IMMEDIATE), waiting up
+        to busy_timeout for it. A deferred transaction that reads and then writes would fail
+        at once with "database is locked" if another connection committed in between.
+        write=False opens a deferred transaction, for consistent reads.
+
+        Nested calls join the outermost transaction, which is the only one
+        that commits (or rolls back if an exception escapes).
+        """
+
+        conn = self.connection()
+
+        if self._local.depth == 0:
+            conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+            self._local.write = write
+        elif write and not self._local.write:
+            raise sqlite3.ProgrammingError('Cannot open a write transaction inside a read transaction')
+
+        cursor = conn.cursor()
+
+        self._local.depth += 1
+
+        try:
+            yield cursor
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.rollback()
+            raise
+        else:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.commit()
+        finally:
+            cursor.close()
+
+    def close_all(self):
+        """Close every connection handed out by this manager."""
+
+        with self._lock:
+            connections, self._connections = list(self._connections), weakref.WeakSet()
+
+        for owner in connections:
+            owner.conn.close()
+
+        self._local = threading.local()
+
+
+_managers:dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+def get_connection_manager(db_file:str) -> ConnectionManager:
+    """Return the process-wide manager of a database file, so every class shares the same connections."""
+
+    with _managers_lock:
+        manager = _managers.get(db_file)
+
+        if manager is None:
+            manager = ConnectionManager(db_file)
+            _managers[db_file] = manager
+
+        return manager
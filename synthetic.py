@@ -0,0 +1,135 @@
+import struct
+from datetime import datetime
+
+# Synthetic fixtures used by the benchmarks
+
+FIT_EPOCH_OFFSET = 631065600 # Seconds between the Unix epoch and the FIT epoch (1989-12-31)
+
+CRC_TABLE = [
+    0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+    0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400
+]
+
+def fit_crc(data:bytes, crc:int=0) -> int:
+
+    for byte in data:
+        tmp = CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ CRC_TABLE[byte & 0xF]
+
+        tmp = CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ CRC_TABLE[(byte >> 4) & 0xF]
+
+    return crc
+
+def _definition(local_type:int, global_num:int, fields:list[tuple[int, int, int]]) -> bytes:
+
+    output = struct.pack('<BBBHB', 0x40 | local_type, 0, 0, global_num, len(fields))
+
+    for field_num, size, base_type in fields:
+        output += struct.pack('BBB', field_num, size, base_type)
+
+    return output
+
+def synthetic_fit_file(seconds:int=3600, lap_distance_m:float=1000, start_timestamp:int=1_700_000_000, enhanced:bool=False) -> bytes:
+    """
+    Build a FIT activity file with one record per second, a lap every lap_distance_m
+    and a closing session, alternating between two paces every 5 minutes.
+    With enhanced, records only hold enhanced_altitude and enhanced_speed, as some devices write.
+    """
+
+    # Record : timestamp, altitude, heart_rate, distance, speed (or their enhanced versions)
+    if enhanced:
+        record_fields = [(253, 4, 0x86), (78, 4, 0x86), (3, 1, 0x02), (5, 4, 0x86), (73, 4, 0x86)]
+    else:
+        record_fields = [(253, 4, 0x86), (2, 2, 0x84), (3, 1, 0x02), (5, 4, 0x86), (6, 2, 0x84)]
+    record_format = '<BIIBII' if enhanced else '<BIHBIH'
+    # Lap : timestamp, start_time, total_elapsed_time, total_distance, avg_speed, total_ascent, total_descent, avg_grade
+    lap_fields = [(253, 4, 0x86), (2, 4, 0x86), (7, 4, 0x86), (9, 4, 0x86), (13, 2, 0x84), (21, 2, 0x84), (22, 2, 0x84), (45, 2, 0x83)]
+    # Session : timestamp, start_time, total_elapsed_time, total_distance, avg_speed, total_ascent, total_descent
+    session_fields = [(253, 4, 0x86), (2, 4, 0x86), (7, 4, 0x86), (9, 4, 0x86), (14, 2, 0x84), (22, 2, 0x84), (23, 2, 0x84)]
+
+    body = bytearray()
+
+    # File id : type = activity
+    body += _definition(0, 0, [(0, 1, 0x00)]) + bytes([0, 4])
+    body += _definition(1, 20, record_fields)
+    body += _definition(2, 19, lap_fields)
+    body += _definition(3, 18, session_fields)
+
+    t0 = start_timestamp - FIT_EPOCH_OFFSET
+    distance = 0.0
+    lap_start, lap_start_distance = 0, 0.0
+    ascent = 0
+
+    for i in range(seconds):
+
+        speed = 3.0 + 0.5 * ((i // 300) % 2)
+        distance += speed
+        altitude = 100 + (i % 120) / 10
+
+        body += struct.pack(record_format, 1, t0+i, int((altitude + 500) * 5), 140 + i % 20, int(distance * 100), int(speed * 1000))
+
+        if distance - lap_start_distance >= lap_distance_m or i == seconds - 1:
+            elapsed = i + 1 - lap_start
+            lap_distance = distance - lap_start_distance
+            lap_ascent = elapsed // 120
+            ascent += lap_ascent
+
+            body += struct.pack('<BIIIIHHHh', 2, t0+i, t0+lap_start, elapsed * 1000, int(lap_distance * 100),
+                                int(lap_distance / elapsed * 1000), lap_ascent, lap_ascent, 0)
+
+            lap_start, lap_start_distance = i + 1, distance
+
+    body += struct.pack('<BIIIIHHH', 3, t0+seconds, t0, seconds * 1000, int(distance * 100),
+                        int(distance / seconds * 1000), ascent, ascent)
+
+    header = struct.pack('<BBHI4s', 14, 0x10, 2093, len(body), b'.FIT')
+    header += struct.pack('<H', fit_crc(header))
+
+    data = header + bytes(body)
+
+    return data + struct.pack('<H', fit_crc(data))
+
+def synthetic_workout(workout_id:int, starts:datetime, minutes:int=45, fit_file_url:str|None=None) -> dict:
+    """Workout as returned by the /v1/workouts endpoint, with dates as strings."""
+
+    date = starts.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    speed = 2.8 + (workout_id % 7) / 10
+
+    summary = {
+        'distance_accum':f'{speed * minutes * 60:0.1f}',
+        'duration_active_accum':str(minutes * 60),
+        'speed_avg':f'{speed:0.3f}',
+    }
+
+    if fit_file_url:
+        summary['file'] = {'url':fit_file_url}
+
+    return {
+        'id':workout_id, 'starts':date, 'minutes':minutes, 'name':'Running', 'plan_id':None,
+        'route_id':None, 'workout_token':f'token-{workout_id}', 'workout_type_id':1, 'day_code':None,
+        'workout_summary':summary, 'created_at':date, 'updated_at':date
+    }
+
+def synthetic_plan(depth:int=4, width:int=3) -> dict:
+    """Plan with repeat intervals nested depth levels deep, each holding width intervals."""
+
+    def interval(level:int, index:int) -> dict:
+
+        if level == depth:
+            return {
+                'name':f'Step {index}', 'exit_trigger_type':'time', 'exit_trigger_value':60 + index,
+                'intensity_type':'tempo', 'targets':[{'type':'threshold_speed', 'low':0.9, 'high':1.0}]
+            }
+
+        return {
+            'name':f'Repeat {level}.{index}', 'exit_trigger_type':'repeat', 'exit_trigger_value':2,
+            'intensity_type':'active', 'intervals':[interval(level + 1, i) for i in range(width)]
+        }
+
+    return {
+        'header':{'name':'Synthetic plan', 'version':'1.0.0', 'workout_type_family':1, 'workout_type_location':1},
+        'intervals':[interval(1, i) for i in range(width)]
+    }
@@ -0,0 +1,46 @@
+import logging
+import os
+import sys
+import tempfile
+import pytest
+
+# The modules are at the repository root, and some of them create files in the working
+# directory when imported (db.sqlite3, api_logs.log, the FIT and record stream caches)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.chdir(tempfile.mkdtemp(prefix='running-coach-tests-'))
+os.makedirs('fit_cache', exist_ok=True)
+os.makedirs('record_streams', exist_ok=True)
+
+
+@pytest.fixture
+def db_file(tmp_path) -> str:
+    return str(tmp_path / 'db.sqlite3')
+
+@pytest.fixture
+def db(db_file):
+    from connections import DatabaseAPI
+
+    db = DatabaseAPI(db_file=db_file, logger=logging.getLogger('tests'))
+    db._create_all_tables()
+
+    return db
+
+@pytest.fixture
+def expired_token_manager(db_file):
+    """Factory of token managers for a fake server, whose stored token is expired so the first call refreshes it."""
+    from datetime import datetime, UTC, timedelta
+    from auth import TokenManager
+
+    def make(token_url:str) -> TokenManager:
+        tokens = TokenManager(db_file=db_file, client_id='tests', client_secret='tests', token_url=token_url)
+        tokens._store_tokens_in_db('expired', datetime.now(UTC) - timedelta(hours=1), 'refresh')
+        return tokens
+
+    return make
+
+@pytest.fixture
+def unlimited_rate_limiter():
+    from rate_limiter import RateLimiter
+
+    return RateLimiter(app_rate=10_000, app_capacity=10_000, class_rates={'read':(10_000, 10_000), 'write':(10_000, 10_000)})
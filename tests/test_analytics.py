@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from analytics import best_efforts
+
+
+def brute_force_best_effort(elapsed:np.ndarray, distance:np.ndarray, target:float) -> float|None:
+    """Fastest [i, j] window covering target, trying every pair of records."""
+
+    best = None
+
+    for i in range(len(distance)):
+        for j in range(i + 1, len(distance)):
+            if distance[j] - distance[i] >= target:
+                best = elapsed[j] - elapsed[i] if best is None else min(best, elapsed[j] - elapsed[i])
+                break # Later ends of the same start are slower
+
+    return best
+
+def synthetic_stream(seconds:int, seed:int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    elapsed = np.cumsum(rng.choice([1.0, 1.0, 2.0], size=seconds)) # Pauses in the recording
+    distance = np.cumsum(rng.uniform(1.5, 5.5, size=seconds))
+    return elapsed, distance
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_brute_force(seed):
+
+    elapsed, distance = synthetic_stream(600, seed)
+    targets = {'400m':400, '1k':1000, '2k':2000, 'too far':10_000}
+
+    efforts = best_efforts(elapsed, distance, targets)
+
+    for name, target in targets.items():
+        assert efforts[name] == brute_force_best_effort(elapsed, distance, target)
+
+def test_missing_and_decreasing_distances():
+
+    elapsed, distance = synthetic_stream(600, 0)
+    noisy = distance.copy()
+    noisy[::50] = np.nan
+    noisy[100] = noisy[99] - 3 # GPS noise going back
+
+    # Both are dropped or flattened the same way as the cleaned stream
+    valid = ~np.isnan(noisy)
+    cleaned = np.maximum.accumulate(noisy[valid])
+
+    assert best_efforts(elapsed, noisy, {'1k':1000}) == {'1k':brute_force_best_effort(elapsed[valid], cleaned, 1000)}
+
+def test_empty_stream():
+    assert best_efforts(np.array([]), np.array([]), {'1k':1000}) == {'1k':None}
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import pytest
+from async_connections import AsyncWahooAPI
+from fake_wahoo import FakeWahooServer
+
+
+@pytest.fixture
+def server():
+    with FakeWahooServer(num_workouts=120, latency_s=0.01) as server:
+        yield server
+
+@pytest.fixture
+def call(server, expired_token_manager, unlimited_rate_limiter):
+    """Run func(wahoo) on a new event loop, with an AsyncWahooAPI of the fake server."""
+
+    tokens = expired_token_manager(server.token_url)
+
+    async def main(func):
+        async with AsyncWahooAPI(base_url=server.api_url, token_manager=tokens) as wahoo:
+            wahoo.rate_limiter = unlimited_rate_limiter
+            return await func(wahoo)
+
+    return lambda func: asyncio.run(main(func))
+
+
+def test_read_workouts(call):
+
+    workouts = call(lambda wahoo: wahoo.read_workouts(per_page=50))
+
+    assert [w.id for w in workouts] == list(range(120, 0, -1))
+
+def test_read_workouts_after(call, server):
+
+    # After is strict : the workout starting at that date is left out
+    after = server.state.latest_start - 10 * server.state.interval
+
+    workouts = call(lambda wahoo: wahoo.read_workouts(after=after, per_page=4))
+
+    assert [w.id for w in workouts] == list(range(120, 110, -1))
+
+def test_plan_round_trip(call, server, db, db_file):
+
+    def stored_plans() -> list[tuple]:
+        return db.pool.connection().execute('SELECT content, wahoo_id FROM plans').fetchall()
+
+    plan_id = call(lambda wahoo: wahoo.upload_plan('cGxhbg==', db))
+
+    assert plan_id in server.state.plans
+    assert stored_plans() == [('cGxhbg==', plan_id)]
+
+    call(lambda wahoo: wahoo.delete_plan(plan_id, db_file, logging.getLogger('tests')))
+
+    assert plan_id not in server.state.plans
+    assert stored_plans() == []
+
+def test_workout_for_today_round_trip(call, server):
+
+    async def upload_and_delete(wahoo):
+        await wahoo.upload_workout_for_today(plan_id=1)
+        # The fake server gives the new workout the id after the history's
+        await wahoo.delete_workout(121)
+
+    call(upload_and_delete)
+
+    requests = [r[1:] for r in server.state.requests if r[2] != '/oauth/token']
+
+    assert requests == [('POST', '/v1/workouts'), ('DELETE', '/v1/workouts/121')]
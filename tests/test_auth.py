@@ -0,0 +1,42 @@
+import threading
+from fake_wahoo import FakeWahooServer
+
+
+def test_concurrent_callers_share_one_refresh(expired_token_manager):
+
+    # The latency keeps the refresh in flight while every thread asks for a token
+    with FakeWahooServer(num_workouts=0, latency_s=0.2) as server:
+
+        tokens = expired_token_manager(server.token_url)
+
+        num_threads = 16
+        barrier = threading.Barrier(num_threads)
+        results = []
+
+        def get_token():
+            barrier.wait()
+            results.append(tokens.get_access_token())
+
+        threads = [threading.Thread(target=get_token) for _ in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        refreshes = [r for r in server.state.requests if r[1:] == ('POST', '/oauth/token')]
+
+    assert len(refreshes) == 1
+    assert len(results) == num_threads and len(set(results)) == 1
+
+def test_refreshed_token_is_reused_from_database(db_file, expired_token_manager):
+    from auth import TokenManager
+
+    with FakeWahooServer(num_workouts=0) as server:
+
+        token = expired_token_manager(server.token_url).get_access_token()
+
+        # A new manager, e.g. in the next run of the app, reads the stored token instead of refreshing
+        other = TokenManager(db_file=db_file, client_id='tests', client_secret='tests', token_url=server.token_url)
+
+        assert other.get_access_token() == token
+        assert len(server.state.requests) == 1
@@ -0,0 +1,37 @@
+import os
+from fit_cache import FitFileCache
+
+
+def cache_bytes(cache_dir) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(cache_dir))
+
+
+def test_size_limit_counts_writes_of_other_processes(tmp_path):
+
+    # Two instances on one directory, as the main process and a parse worker have
+    main, worker = FitFileCache(str(tmp_path), max_bytes=10_000), FitFileCache(str(tmp_path), max_bytes=10_000)
+
+    for workout_id in range(8):
+        worker.put(workout_id, f'http://files/{workout_id}.fit', b'x' * 2_000)
+
+    main.put(100, 'http://files/100.fit', b'x' * 2_000)
+
+    assert cache_bytes(tmp_path) <= 10_000
+    # The most recent file is kept
+    assert main.get(100, 'http://files/100.fit') == b'x' * 2_000
+
+def test_least_recently_used_is_evicted(tmp_path):
+
+    cache = FitFileCache(str(tmp_path), max_bytes=5_000)
+
+    cache.put(1, 'http://files/1.fit', b'1' * 2_000)
+    cache.put(2, 'http://files/2.fit', b'2' * 2_000)
+    os.utime(cache._path(1, 'http://files/1.fit'), (1, 1))
+    os.utime(cache._path(2, 'http://files/2.fit'), (2, 2))
+
+    cache.get(1, 'http://files/1.fit') # Now the most recently used
+    cache.put(3, 'http://files/3.fit', b'3' * 2_000)
+
+    assert cache.get(2, 'http://files/2.fit') is None
+    assert cache.get(1, 'http://files/1.fit') == b'1' * 2_000
+    assert cache.get(3, 'http://files/3.fit') == b'3' * 2_000
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from io import BytesIO
+import fitparse
+from fit_decoder import decode_messages
+from models import LAP_FIELDS
+from record_streams import _decode_record_streams_fast, _decode_record_streams_fitparse
+from synthetic import synthetic_fit_file
+
+
+def test_laps_match_fitparse():
+
+    content = synthetic_fit_file(seconds=1800)
+
+    laps = decode_messages(content, messages=('lap',))['lap']
+    expected = [{key:lap.get_value(key) for key in LAP_FIELDS} for lap in fitparse.FitFile(BytesIO(content)).get_messages('lap')]
+
+    assert len(laps) == len(expected) > 1
+    for lap, expected_lap in zip(laps, expected):
+        assert lap == pytest.approx(expected_lap)
+
+@pytest.mark.parametrize('enhanced', [False, True])
+def test_record_streams_match_fitparse(enhanced):
+
+    content = synthetic_fit_file(seconds=600, enhanced=enhanced)
+
+    fast, slow = _decode_record_streams_fast(content), _decode_record_streams_fitparse(content)
+
+    assert fast.keys() == slow.keys()
+    for key in fast:
+        np.testing.assert_allclose(fast[key], slow[key], equal_nan=True)
+
+def test_not_a_fit_file():
+    with pytest.raises(ValueError):
+        decode_messages(b'\x0e' + b'\x00' * 20)
@@ -0,0 +1,32 @@
+from datetime import date, datetime, UTC, timedelta
+import pytest
+from models import WorkoutData
+from synthetic import synthetic_workout
+
+
+@pytest.fixture
+def workouts(db) -> list[WorkoutData]:
+    workouts = [WorkoutData(**synthetic_workout(i, datetime(2024, 6, 1, 7, tzinfo=UTC) + timedelta(days=i))) for i in range(1, 11)]
+    db.upload_workouts(workouts)
+    return workouts
+
+
+def test_range_and_order(db, workouts):
+
+    ids = [w.id for w in db.iter_workouts(since=date(2024, 6, 3), until=date(2024, 6, 6), batch_size=2)]
+
+    assert ids == [2, 3, 4]
+    assert [w.id for w in db.iter_workouts(descending=True)] == list(range(10, 0, -1))
+
+def test_summary_metric_columns(db, workouts):
+
+    rows = list(db.iter_workouts(columns=('id', 'distance_m', 'duration_s', 'speed_avg')))
+
+    assert rows == [
+        (w.id, float(w.workout_summary['distance_accum']), float(w.workout_summary['duration_active_accum']), float(w.workout_summary['speed_avg']))
+        for w in workouts
+    ]
+
+def test_unknown_column(db):
+    with pytest.raises(ValueError):
+        list(db.iter_workouts(columns=('id', 'starts; DROP TABLE workouts')))
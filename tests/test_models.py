@@ -0,0 +1,62 @@
+import os
+import signal
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, UTC
+from connections import DatabaseAPI
+from models import WorkoutData, get_parse_pool, submit_parse
+from synthetic import synthetic_workout
+
+
+def validated_and_from_row() -> tuple[WorkoutData, WorkoutData]:
+    validated = WorkoutData(**synthetic_workout(1, datetime(2024, 6, 1, 7, 30, tzinfo=UTC)))
+    return validated, WorkoutData.from_db_row(DatabaseAPI._workout_to_row(validated))
+
+
+def test_from_db_row_matches_validated_model():
+
+    validated, from_row = validated_and_from_row()
+
+    assert from_row == validated
+    assert validated == from_row
+    assert repr(from_row) == repr(validated)
+
+    validated, from_row = validated_and_from_row()
+
+    assert from_row.model_dump() == validated.model_dump()
+    assert from_row.model_dump_json() == validated.model_dump_json()
+
+def test_from_db_row_decodes_summary_once():
+
+    validated, from_row = validated_and_from_row()
+
+    assert 'workout_summary' not in from_row.__dict__
+
+    summary = from_row.workout_summary
+
+    assert summary == validated.workout_summary
+    assert from_row.workout_summary is summary
+
+def test_from_db_row_without_summary():
+
+    validated = WorkoutData(**{**synthetic_workout(1, datetime(2024, 6, 1, tzinfo=UTC)), 'workout_summary':None})
+    from_row = WorkoutData.from_db_row(DatabaseAPI._workout_to_row(validated))
+
+    assert from_row.workout_summary is None
+    assert from_row == validated
+
+
+def test_submit_parse_replaces_a_broken_pool():
+
+    pool = get_parse_pool()
+    pid = pool.submit(os.getpid).result()
+
+    # Killing a worker breaks the pool : the next submission goes to a new one
+    os.kill(pid, signal.SIGKILL)
+
+    with pytest.raises(BrokenProcessPool):
+        for _ in range(1000):
+            pool.submit(int).result()
+
+    assert submit_parse(pow, 2, 10).result() == 1024
+    assert get_parse_pool() is not pool
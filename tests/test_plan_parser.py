@@ -0,0 +1,79 @@
+import pytest
+from models import IntensityType, TargetType, TriggerType
+from plan_parser import PlanParseError, parse_workout_markdown
+from utils import pace_to_speed_mps
+
+STANDARD = """
+# Today's workout
+
+## 1 Warm-Up
+- Description : Easy jog
+- Parameters : Time: 10 minutes, Pace: 6:00-6:30 min/km
+### 2 Intervals
+- Repetitions: 5
+- Subsets :
+    ## 2.1 Hard
+    - Description : Fast
+    - Parameters : Distance: 400 m, Pace: 4:10-4:20 min/km
+    ## 2.2 Recovery
+    - Parameters : Time: 1:30, Pace: 6:30-7:00 min/km
+## 3 **Cool Down**
+- **Parameters** : Distance: 1.5 km, Pace: 6:30-7:00 min/km
+
+### Summary
+- Parameters : Time: 99 minutes, Pace: 1:00-2:00 min/km
+"""
+
+
+def test_standard_format():
+
+    warm_up, intervals, cool_down = parse_workout_markdown(STANDARD)
+
+    assert warm_up.name == 'Warm-Up'
+    assert (warm_up.exit_trigger_type, warm_up.exit_trigger_value) == (TriggerType.time, 600)
+    assert warm_up.intensity_type == IntensityType.wu
+    assert warm_up.targets[0].type == TargetType.speed
+    assert (warm_up.targets[0].low, warm_up.targets[0].high) == (pace_to_speed_mps(6, 30), pace_to_speed_mps(6, 0))
+
+    # Wahoo counts the repeats after the first iteration
+    assert (intervals.exit_trigger_type, intervals.exit_trigger_value) == (TriggerType.repeat, 4)
+    hard, recovery = intervals.intervals
+    assert (hard.exit_trigger_type, hard.exit_trigger_value) == (TriggerType.distance, 400)
+    assert hard.intensity_type == IntensityType.active
+    assert (recovery.exit_trigger_type, recovery.exit_trigger_value) == (TriggerType.time, 90)
+    assert recovery.intensity_type == IntensityType.recover
+
+    # Emphasis is stripped, and the unnumbered heading after the intervals ends the workout
+    assert cool_down.name == 'Cool Down'
+    assert (cool_down.exit_trigger_type, cool_down.exit_trigger_value) == (TriggerType.distance, 1500)
+
+@pytest.mark.parametrize('markdown', [
+    # No numbered headings
+    'Run 5 km easy',
+    '# Workout\n- Parameters : Time: 10 minutes, Pace: 6:00-6:30 min/km',
+    # Leaf without parameters
+    '## 1 Warm-Up\n- Description : Easy',
+    # Parameters
+    '## 1 Run\n- Parameters : Time 10 minutes, Pace: 6:00-6:30 min/km',
+    '## 1 Run\n- Parameters : Time: 10 minutes',
+    '## 1 Run\n- Parameters : Pace: 6:00-6:30 min/km',
+    '## 1 Run\n- Parameters : Time: 10 minutes, Distance: 2 km, Pace: 6:00-6:30 min/km',
+    '## 1 Run\n- Parameters : Time: 10-15 minutes, Pace: 6:00-6:30 min/km',
+    '## 1 Run\n- Parameters : Time: a while, Pace: 6:00-6:30 min/km',
+    '## 1 Run\n- Parameters : Distance: 2 miles, Pace: 6:00-6:30 min/km',
+    '## 1 Run\n- Parameters : Time: 10 minutes, Pace: 6:00 min/km',
+    '## 1 Run\n- Parameters : Time: 10 minutes, Pace: 6:00-6:00 min/km',
+    # Duplicate items
+    '## 1 Run\n- Parameters : Time: 10 minutes, Pace: 6:00-6:30 min/km\n- Parameters : Time: 5 minutes, Pace: 6:00-6:30 min/km',
+    # Repetitions
+    '## 1.1 Hard\n- Parameters : Time: 1 minute, Pace: 4:00-4:10 min/km',
+    '### 1 Intervals\n- Repetitions: many\n## 1.1 Hard\n- Parameters : Time: 1 minute, Pace: 4:00-4:10 min/km',
+    '### 1 Intervals\n- Repetitions: 0\n## 1.1 Hard\n- Parameters : Time: 1 minute, Pace: 4:00-4:10 min/km',
+    '### 1 Intervals\n- Repetitions: 3',
+    # Duplicate block numbers
+    '### 2 Intervals\n- Repetitions: 3\n## 2.1 Hard\n- Parameters : Time: 1 minute, Pace: 4:00-4:10 min/km\n'
+    '### 2 Hills\n- Repetitions: 4\n## 2.1 Up\n- Parameters : Time: 1 minute, Pace: 5:00-5:10 min/km',
+])
+def test_unsupported_markdown_raises(markdown):
+    with pytest.raises(PlanParseError):
+        parse_workout_markdown(markdown)
@@ -0,0 +1,11 @@
+from connections import DatabaseAPI
+
+
+def test_hot_queries_use_indexes(db):
+    plans = db.check_query_plans()
+
+    assert set(plans) == {name for name, _, _ in DatabaseAPI.hot_queries}
+
+def test_bounded_plan_steps_name_hot_queries():
+    # An allowance left behind by a renamed query would silently stop applying
+    assert set(DatabaseAPI.bounded_plan_steps) <= {name for name, _, _ in DatabaseAPI.hot_queries}
@@ -0,0 +1,33 @@
+from datetime import datetime, UTC, timedelta
+from models import WorkoutData
+from synthetic import synthetic_workout
+
+
+def rollup_rows(db) -> dict[str, list[tuple]]:
+    conn = db.pool.connection()
+    return {table:conn.execute(f'SELECT * FROM {table} ORDER BY 1').fetchall() for table in db.rollups}
+
+def workout(workout_id:int, starts:datetime) -> WorkoutData:
+    return WorkoutData(**synthetic_workout(workout_id, starts))
+
+
+def test_incremental_rollups_match_rebuild(db):
+
+    first_start = datetime(2024, 5, 1, 7, tzinfo=UTC)
+
+    db.upload_workouts([workout(i, first_start + timedelta(days=2 * i)) for i in range(1, 41)], chunk_size=15)
+    db._add_feedback(3, 7, 'Hard')
+
+    # Upserts moving workouts to other weeks and months, in two chunks
+    db.upload_workouts([
+        workout(1, datetime(2024, 7, 20, 7, tzinfo=UTC)),
+        workout(21, datetime(2024, 3, 2, 7, tzinfo=UTC)),
+        workout(3, datetime(2024, 8, 1, 7, tzinfo=UTC)),
+    ], chunk_size=2)
+
+    incremental = rollup_rows(db)
+
+    db.rebuild_rollups()
+
+    assert incremental == rollup_rows(db)
+    assert [row[0] for row in incremental['monthly_rollup']] == ['2024-03', '2024-05', '2024-06', '2024-07', '2024-08']
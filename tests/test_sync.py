@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+import time
+import pytest
+import requests
+from connections import WahooAPI
+from fake_wahoo import FakeWahooServer
+from http_client import http_client
+
+
+@pytest.fixture
+def server():
+    with FakeWahooServer(num_workouts=100) as server:
+        yield server
+
+@pytest.fixture
+def wahoo(server, expired_token_manager, unlimited_rate_limiter):
+    wahoo = WahooAPI(base_url=server.api_url, token_manager=expired_token_manager(server.token_url))
+    wahoo.rate_limiter = unlimited_rate_limiter
+    return wahoo
+
+def stored_ids(db) -> list[int]:
+    return [row[0] for row in db.pool.connection().execute('SELECT id FROM workouts ORDER BY id')]
+
+
+def test_sync_resumes_after_failed_page(db, server, wahoo, monkeypatch):
+
+    db.update_workouts_table(wahoo)
+
+    server.state.add_workouts(120)
+
+    # The page after the newest one fails, once the newest workouts are already stored
+    monkeypatch.setattr(http_client, 'max_retries', 0)
+    server.state.failing_pages.add(2)
+
+    with pytest.raises(requests.HTTPError):
+        db.update_workouts_table(wahoo)
+
+    assert 100 < len(stored_ids(db)) < 220
+
+    server.state.failing_pages.clear()
+
+    db.update_workouts_table(wahoo)
+
+    assert stored_ids(db) == list(range(1, 221))
+
+def test_writes_are_not_blocked_while_laps_download(db, expired_token_manager, unlimited_rate_limiter):
+
+    with FakeWahooServer(num_workouts=20, latency_s=0.3, with_fit_files=True) as server:
+
+        wahoo = WahooAPI(base_url=server.api_url, token_manager=expired_token_manager(server.token_url))
+        wahoo.rate_limiter = unlimited_rate_limiter
+
+        workouts = wahoo.read_workouts()
+        db.upload_workouts(workouts)
+
+        # Connections opened from now on wait at most 0.2s for the write lock
+        db.pool.busy_timeout_ms = 200
+        errors = []
+
+        def add_feedback():
+            time.sleep(0.1)
+            try:
+                db._add_feedback(workouts[0].id, 5, 'Easy')
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=add_feedback)
+        thread.start()
+
+        stored = db.store_workouts_laps(workouts)
+        thread.join()
+
+    assert len(stored) == 20
+    assert errors == []
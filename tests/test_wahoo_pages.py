@@ -0,0 +1,44 @@
+import pytest
+from connections import WahooAPI
+from fake_wahoo import FakeWahooServer
+from rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def server():
+    with FakeWahooServer(num_workouts=1000, latency_s=0.01, jitter_s=0.02) as server:
+        yield server
+
+@pytest.fixture
+def wahoo(server, expired_token_manager, unlimited_rate_limiter):
+    wahoo = WahooAPI(base_url=server.api_url, token_manager=expired_token_manager(server.token_url))
+    wahoo.rate_limiter = unlimited_rate_limiter
+    return wahoo
+
+
+def test_concurrent_read_keeps_page_order(wahoo):
+
+    workouts = wahoo.read_workouts(per_page=30, max_workers=8)
+
+    # Most recent first, as a sequential read returns them
+    assert [w.id for w in workouts] == list(range(1000, 0, -1))
+
+def test_concurrent_read_stays_under_read_rate(wahoo, server):
+
+    rate = 20
+
+    # The athlete's read bucket holds a single token, so the requests are spaced by 1/rate
+    wahoo.rate_limiter = RateLimiter(app_rate=10_000, app_capacity=10_000, class_rates={'read':(rate, 1), 'write':(rate, 1)})
+
+    wahoo.read_workouts(per_page=50, max_workers=8)
+
+    arrivals = sorted(t for t, method, path in server.state.requests if path == '/v1/workouts')
+
+    assert len(arrivals) == 20
+
+    # Without the limiter, 8 workers send the 20 requests in about 3 rounds of latency
+    span = arrivals[-1] - arrivals[0]
+    assert span >= 0.9 * (len(arrivals) - 1) / rate
+
+    # No half second holds more than half the rate, give or take the jitter
+    assert max(sum(start <= t < start + 0.5 for t in arrivals) for start in arrivals) <= rate / 2 + 2
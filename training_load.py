@@ -0,0 +1,54 @@
+import math
+from datetime import date, timedelta
+
+DEFAULT_THRESHOLD_SPEED = 3.33 # m/s (5:00min/km), used until a threshold can be estimated
+
+ATL_DAYS = 7  # Fatigue time constant
+CTL_DAYS = 42 # Fitness time constant
+
+
+def workout_load(minutes:int, summary:dict|None, threshold_speed:float) -> float:
+    """
+    Training stress of a run, scored like rTSS : hours * (speed / threshold speed)^2 * 100,
+    so one hour at threshold pace is worth 100.
+    """
+
+    summary = summary or {}
+
+    duration_s = float(summary.get('duration_active_accum') or 0) or minutes * 60
+
+    if not duration_s:
+        return 0.0
+
+    speed = summary.get('speed_avg')
+
+    if speed is None:
+        speed = float(summary.get('distance_accum') or 0) / duration_s
+
+    intensity = float(speed) / threshold_speed
+
+    return duration_s / 3600 * intensity ** 2 * 100
+
+def ewma_series(first_day:date, loads:list[float], atl:float=0.0, ctl:float=0.0) -> list[tuple[date, float, float, float, float]]:
+    """
+    Continue the ATL/CTL series from the values of the day before first_day.
+
+    Returns (day, load, atl, ctl, tsb) for each day, where TSB is the form going into
+    the day : yesterday's fitness minus yesterday's fatigue.
+    """
+
+    atl_decay = math.exp(-1 / ATL_DAYS)
+    ctl_decay = math.exp(-1 / CTL_DAYS)
+
+    output = []
+
+    for i, load in enumerate(loads):
+
+        tsb = ctl - atl
+
+        atl = atl * atl_decay + load * (1 - atl_decay)
+        ctl = ctl * ctl_decay + load * (1 - ctl_decay)
+
+        output.append((first_day + timedelta(days=i), load, atl, ctl, tsb))
+
+    return output
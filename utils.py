@@ -44,6 +44,15 @@ def speed_to_pace(speed_mps):
     return f"{minutes}:{seconds:02d}min/km"
 
 
+def minutes_to_secs(minutes, seconds):
+    return minutes*60 + seconds
+
+def pace_to_speed_mps(pace_min, pace_sec):
+    # Pace in min/km to meters per second
+    total_seconds_per_km = (pace_min * 60) + pace_sec
+    return round(1000 / total_seconds_per_km, 3)
+
+
 def get_default_header_data(name, description):
     return {
         'name':name,